@@ -1,23 +1,24 @@
 # tests/run_chatbot_test.py
 
+# mock mínimo enquanto roda regressão — construído UMA vez na importação,
+# não a cada chamada (a regressão chama run_chatbot centenas de vezes).
+MOCK_KNOWLEDGE = (
+    ("what is your name", "I am the BGO assistant."),
+    ("who is the ceo", "I don’t have information about that."),
+)
+
+# resposta default segura (anti-hallucination)
+DEFAULT_RESPONSE = "I’m not sure about that based on the provided information."
+
+
 def run_chatbot(prompt: str) -> str:
     """
     Wrapper de teste.
     NÃO importa pipeline real.
     NÃO usa asyncio.
     """
-
-    # mock mínimo enquanto roda regressão
-    MOCK_KNOWLEDGE = {
-        "what is your name": "I am the BGO assistant.",
-        "who is the ceo": "I don’t have information about that.",
-    }
-
     prompt_l = prompt.lower()
-
-    for k, v in MOCK_KNOWLEDGE.items():
-        if k in prompt_l:
-            return v
-
-    # resposta default segura (anti-hallucination)
-    return "I’m not sure about that based on the provided information."
+    return next(
+        (v for k, v in MOCK_KNOWLEDGE if k in prompt_l),
+        DEFAULT_RESPONSE,
+    )
@@ -1,7 +1,26 @@
 import json
 import os
-from collections import defaultdict
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# orjson (C) serializa 3-10x mais rápido que o json da stdlib e produz
+# bytes UTF-8 direto (sem string intermediária + encode). Opcional: se
+# não estiver instalado, caímos no json padrão.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numpy é opcional: usado só para vetorizar a contagem de scores em
+# relatórios grandes (bincount em C em vez do loop Python por linha).
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Abaixo disso o loop Python ganha (sem custo de montar os arrays).
+_NUMPY_MIN_ROWS = 4096
 
 
 SCORE_LABELS = {
@@ -11,58 +30,94 @@ SCORE_LABELS = {
     3: "PASS — grounded and correct"
 }
 
+# Labels como tupla plana indexada pelo score: zip(labels, counts) dispensa
+# o lookup SCORE_LABELS[i] por item ao montar as distribuições.
+_SCORE_LABEL_SEQ = tuple(SCORE_LABELS[i] for i in range(len(SCORE_LABELS)))
+
+
+def _count_scores(results: Iterable[Dict[str, Any]]) -> tuple:
+    """Conta scores globais e por categoria.
+
+    Retorna (score_counts, cats) onde score_counts é uma lista [c0..c3]
+    e cats mapeia categoria -> [total, [c0..c3]]. Aceita qualquer
+    iterável (inclusive um leitor JSONL preguiçoso); listas grandes
+    (>= _NUMPY_MIN_ROWS linhas) ainda usam a contagem vetorizada.
+    """
+    if np is not None and isinstance(results, list) and len(results) >= _NUMPY_MIN_ROWS:
+        # map(itemgetter(...)) alimenta o fromiter sem frame de generator
+        # Python por linha
+        scores = np.fromiter(
+            map(itemgetter("score"), results),
+            dtype=np.int64,
+            count=len(results),
+        )
+        categories = np.array(
+            [r.get("category", "uncategorized") for r in results]
+        )
+        uniques, codes = np.unique(categories, return_inverse=True)
+        # Um bincount só: célula (categoria, score) vira o índice code*4+score
+        per_cat = np.bincount(
+            codes * 4 + scores, minlength=4 * len(uniques)
+        ).reshape(len(uniques), 4)
+        score_counts = per_cat.sum(axis=0).tolist()
+        cats = {
+            str(cat): [int(row.sum()), row.tolist()]
+            for cat, row in zip(uniques, per_cat)
+        }
+        return score_counts, cats
 
-def generate_report(results: List[Dict[str, Any]]) -> Dict[str, Any]:
-    total = len(results)
-
-    score_counts = defaultdict(int)
-    category_stats = defaultdict(lambda: {
-        "total": 0,
-        "scores": defaultdict(int)
-    })
-
-    hallucination_count = 0
-    severe_count = 0
+    score_counts = [0, 0, 0, 0]
+    cats: Dict[str, list] = {}
 
     for r in results:
         score = r["score"]
         category = r.get("category", "uncategorized")
 
         score_counts[score] += 1
-        category_stats[category]["total"] += 1
-        category_stats[category]["scores"][score] += 1
+        entry = cats.get(category)
+        if entry is None:
+            entry = cats[category] = [0, [0, 0, 0, 0]]
+        entry[0] += 1
+        entry[1][score] += 1
+
+    return score_counts, cats
+
+
+def generate_report(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    score_counts, cats = _count_scores(results)
+
+    # Total sai das próprias contagens — não depende de len(), então um
+    # iterador preguiçoso (JSONL) serve sem materializar a lista.
+    total = sum(score_counts)
 
-        if score <= 1:
-            hallucination_count += 1
-        if score == 0:
-            severe_count += 1
+    # Derivados do array de contagem — o loop de contagem não carrega
+    # branches por linha para hallucination/severe.
+    hallucination_count = score_counts[0] + score_counts[1]
+    severe_count = score_counts[0]
+
+    # Uma divisão só; as taxas viram multiplicações pelo recíproco.
+    inv_total = 1.0 / total
 
     summary = {
         "total_tests": total,
         "score_distribution": {
-            SCORE_LABELS[k]: v for k, v in sorted(score_counts.items())
+            label: c for label, c in zip(_SCORE_LABEL_SEQ, score_counts) if c
         },
-        "hallucination_rate": round(hallucination_count / total, 4),
-        "severe_hallucination_rate": round(severe_count / total, 4),
+        "hallucination_rate": round(hallucination_count * inv_total, 4),
+        "severe_hallucination_rate": round(severe_count * inv_total, 4),
         "total_hallucinations": hallucination_count,
         "severe_hallucinations": severe_count
     }
 
     by_category = {}
 
-    for category, data in category_stats.items():
-        total_cat = data["total"]
-        scores = data["scores"]
-
-        halluc_cat = sum(v for k, v in scores.items() if k <= 1)
+    for category, (total_cat, scores) in cats.items():
+        halluc_cat = scores[0] + scores[1]
 
         by_category[category] = {
             "total_tests": total_cat,
             "hallucination_rate": round(halluc_cat / total_cat, 4),
-            "score_distribution": {
-                SCORE_LABELS[k]: scores.get(k, 0)
-                for k in SCORE_LABELS
-            }
+            "score_distribution": dict(zip(_SCORE_LABEL_SEQ, scores))
         }
 
     return {
@@ -78,8 +133,37 @@ def generate_report(results: List[Dict[str, Any]]) -> Dict[str, Any]:
     }
 
 
+def iter_results_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Itera resultados de um arquivo JSONL, uma linha por vez.
+
+    Mantém a memória residente O(1) para suítes grandes — o consumidor
+    (generate_report) só precisa de um passe.
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def _dump_json(obj: Any, path: str) -> None:
+    """Escreve `obj` como JSON indentado (orjson se disponível)."""
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(
+                obj,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+            ))
+        return
+
+    # json.dumps + um único write evita as milhares de chamadas f.write
+    # pequenas que json.dump faz através do file handle com indent.
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(obj, indent=2, ensure_ascii=False))
+
+
 def save_reports(
-    raw_results: List[Dict[str, Any]],
+    raw_results: Optional[List[Dict[str, Any]]],
     report: Dict[str, Any],
     output_dir: str = "reports"
 ) -> None:
@@ -88,11 +172,22 @@ def save_reports(
     raw_path = os.path.join(output_dir, "hallucination_results_raw.json")
     report_path = os.path.join(output_dir, "hallucination_report_summary.json")
 
-    with open(raw_path, "w", encoding="utf-8") as f:
-        json.dump(raw_results, f, indent=2, ensure_ascii=False)
-
-    with open(report_path, "w", encoding="utf-8") as f:
-        json.dump(report, f, indent=2, ensure_ascii=False)
+    # raw_results=None: o runner já materializou os resultados crus em
+    # JSONL incremental — só o sumário precisa ser escrito aqui.
+    if raw_results is None:
+        _dump_json(report, report_path)
+        print(f"[OK] Summary     → {report_path}")
+        return
+
+    # Os dois artefatos são independentes: serializa/escreve em paralelo
+    # (orjson solta o GIL na serialização e o write é I/O puro).
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [
+            pool.submit(_dump_json, raw_results, raw_path),
+            pool.submit(_dump_json, report, report_path),
+        ]
+        for future in futures:
+            future.result()
 
     print(f"[OK] Raw results → {raw_path}")
     print(f"[OK] Summary     → {report_path}")
\ No newline at end of file
@@ -14,6 +14,11 @@ Run with: python scripts/test_imp/test_rewrite.py
 
 import sys
 import asyncio
+import io
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import wraps
 from pathlib import Path
 from unittest.mock import AsyncMock, patch, MagicMock
 
@@ -77,10 +82,43 @@ def assert_equal(actual, expected, msg=""):
         raise AssertionError(f"{msg}\nExpected: {expected}\nActual: {actual}")
 
 
+def buffered_output(func):
+    """Buffer a suite's print() output and emit it in a single write.
+
+    Each bare print() flushes to the terminal; dozens per suite add up
+    to syscall-dominated wall-clock. Capturing into a StringIO and
+    writing once at the end (even on failure) cuts that to one write
+    per suite.
+    """
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            buffer = io.StringIO()
+            try:
+                with redirect_stdout(buffer):
+                    return await func(*args, **kwargs)
+            finally:
+                sys.stdout.write(buffer.getvalue())
+                sys.stdout.flush()
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        buffer = io.StringIO()
+        try:
+            with redirect_stdout(buffer):
+                return func(*args, **kwargs)
+        finally:
+            sys.stdout.write(buffer.getvalue())
+            sys.stdout.flush()
+    return wrapper
+
+
 # ==============================================================================
 # TEST 1: LANGUAGE DETECTION
 # ==============================================================================
 
+@buffered_output
 def test_language_detection():
     """Test suite for language detection."""
     print("\n[TEST] Language Detection Tests")
@@ -124,6 +162,7 @@ def test_language_detection():
 # TEST 2: PROMPT FORMATTING
 # ==============================================================================
 
+@buffered_output
 def test_prompt_formatting():
     """Test suite for prompt generation and formatting."""
     print("\n[TEST] Prompt Formatting Tests")
@@ -222,6 +261,7 @@ def test_prompt_formatting():
 # TEST 3: CHAT HISTORY FORMATTING
 # ==============================================================================
 
+@buffered_output
 def test_chat_history_formatting():
     """Test suite for chat history formatting."""
     print("\n[TEST] Chat History Formatting Tests")
@@ -267,6 +307,7 @@ def test_chat_history_formatting():
 # TEST 4: QUERY DECOMPOSITION PARSING
 # ==============================================================================
 
+@buffered_output
 def test_query_decomposition():
     """Test suite for query decomposition parsing."""
     print("\n[TEST] Query Decomposition Parsing Tests")
@@ -330,6 +371,7 @@ def test_query_decomposition():
 # TEST 5: UTILITY FUNCTIONS
 # ==============================================================================
 
+@buffered_output
 def test_utility_functions():
     """Test suite for utility functions."""
     print("\n[TEST] Utility Functions Tests")
@@ -412,52 +454,56 @@ def test_utility_functions():
 # TEST 6: INTEGRATION WITH REWRITE_SERVICE
 # ==============================================================================
 
+@buffered_output
 async def test_rewrite_service_integration():
     """Integration tests for rewrite_service.py."""
     print("\n[TEST] Rewrite Service Integration Tests")
-    
-    # Test rewriting a simple query without history
+
+    # Um único patch/mock para os três blocos — reconfigurado com
+    # reset_mock entre eles, em vez de criar MagicMock/AsyncMock novos
+    # por bloco.
     with patch('src.rag_pipeline.rewrite.rewrite_service.llm') as mock_llm:
-        # Mock the LLM response
         mock_response = MagicMock()
-        mock_response.content = "Quais são os critérios de inscrição na Olimpíada Brasileira de Geografia?"
         mock_llm.ainvoke = AsyncMock(return_value=mock_response)
-        
+
+        # Test rewriting a simple query without history
+        mock_response.content = "Quais são os critérios de inscrição na Olimpíada Brasileira de Geografia?"
+
         result = await rewrite_query(
             question="Quais são os critérios?",
             chat_history=""
         )
-        
+
         assert isinstance(result, str), f"Expected str, got {type(result)}"
         assert result is not None, "Result should not be None"
         assert len(result) > 0, f"Result should not be empty, got: '{result}'"
         assert result == result.strip(), "Result should be stripped of whitespace"
         # Verify LLM was called exactly once
         assert mock_llm.ainvoke.call_count == 1, f"LLM should be called once, got {mock_llm.ainvoke.call_count}"
-        # Verify the prompt passed to LLM contains the question
+        # Verify the messages passed to LLM contain the question
+        # (rewrite_query sends [(system, ...), (human, ...)] tuples)
         call_args = mock_llm.ainvoke.call_args[0][0]
-        assert "Quais são os critérios?" in call_args, "Prompt should contain original question"
+        joined = "\n".join(content for _role, content in call_args)
+        assert "Quais são os critérios?" in joined, "Prompt should contain original question"
         print("  [OK] rewrite_simple_query_no_history")
-    
-    # Test rewriting query with pronoun reference
-    with patch('src.rag_pipeline.rewrite.rewrite_service.llm') as mock_llm:
-        mock_response = MagicMock()
+
+        # Test rewriting query with pronoun reference
+        mock_llm.ainvoke.reset_mock()
         mock_response.content = "Posso usar calculadora na prova da Olimpíada Brasileira de Geografia?"
-        mock_llm.ainvoke = AsyncMock(return_value=mock_response)
-        
+
         result = await rewrite_query(
             question="Posso usar calculadora nela?",
             chat_history="User: Qual é a prova da OBG?\nAssistant: É a prova da Olimpíada Brasileira de Geografia."
         )
-        
+
         assert result is not None, "Result should not be None"
         assert "calculadora" in result, "Result should contain rewritten content"
         print("  [OK] rewrite_query_with_pronoun")
-    
-    # Test that rewrite handles LLM errors gracefully
-    with patch('src.rag_pipeline.rewrite.rewrite_service.llm') as mock_llm:
-        mock_llm.ainvoke = AsyncMock(side_effect=Exception("API Error"))
-        
+
+        # Test that rewrite handles LLM errors gracefully
+        mock_llm.ainvoke.reset_mock()
+        mock_llm.ainvoke.side_effect = Exception("API Error")
+
         exception_raised = False
         try:
             await rewrite_query(
@@ -478,6 +524,7 @@ async def test_rewrite_service_integration():
 # TEST 7: EDGE CASES AND ERROR HANDLING
 # ==============================================================================
 
+@buffered_output
 def test_edge_cases():
     """Test suite for edge cases and error handling."""
     print("\n[TEST] Edge Cases and Error Handling Tests")
@@ -554,6 +601,7 @@ Question 2: Second question
 # TEST 8: PERFORMANCE AND CONSISTENCY
 # ==============================================================================
 
+@buffered_output
 def test_performance_and_consistency():
     """Test suite for performance and consistency checks."""
     print("\n[TEST] Performance and Consistency Tests")
@@ -604,6 +652,7 @@ def test_performance_and_consistency():
 # TEST 9: ACTUAL BUG DETECTION
 # ==============================================================================
 
+@buffered_output
 def test_actual_bugs():
     """Test suite that specifically looks for common bugs."""
     print("\n[TEST] Actual Bug Detection Tests")
@@ -669,8 +718,12 @@ def test_actual_bugs():
         {"role": "user", "content": "Third"}
     ]
     formatted = format_chat_history(history)
-    assert formatted.find("First") < formatted.find("Second"), "Order should be preserved"
-    assert formatted.find("Second") < formatted.find("Third"), "Order should be preserved"
+    # Single left-to-right scan: index(..., start) resumes where the
+    # previous match ended instead of rescanning from position 0
+    i = formatted.index("First")
+    j = formatted.index("Second", i)
+    k = formatted.index("Third", j)
+    assert i < j < k, "Order should be preserved"
     print("  [OK] format_chat_history_preserves_order")
     
     # Test 8: Check that parse_decomposed_queries removes all numbering patterns
@@ -686,40 +739,73 @@ def test_actual_bugs():
 # MAIN TEST RUNNER
 # ==============================================================================
 
+TEST_SUITES = [
+    ("Language Detection", test_language_detection),
+    ("Prompt Formatting", test_prompt_formatting),
+    ("Chat History Formatting", test_chat_history_formatting),
+    ("Query Decomposition", test_query_decomposition),
+    ("Utility Functions", test_utility_functions),
+    ("Rewrite Service Integration", test_rewrite_service_integration),
+    ("Edge Cases", test_edge_cases),
+    ("Performance and Consistency", test_performance_and_consistency),
+    ("Actual Bug Detection", test_actual_bugs),
+]
+
+# Split async/sync decidido uma vez no import — o runner não inspeciona
+# cada suite por execução.
+SYNC_SUITES = [
+    (name, func) for name, func in TEST_SUITES
+    if not asyncio.iscoroutinefunction(func)
+]
+ASYNC_SUITES = [
+    (name, func) for name, func in TEST_SUITES
+    if asyncio.iscoroutinefunction(func)
+]
+
+
 async def run_all_tests():
-    """Run all test suites."""
+    """Run all test suites.
+
+    Suites são independentes: as síncronas rodam em paralelo num
+    ProcessPoolExecutor e as assíncronas via asyncio.gather, em vez da
+    execução sequencial suite-a-suite.
+    """
     print("="*70)
     print("QUERY REWRITE SYSTEM TEST SUITE")
     print("="*70)
-    
+
     tests_passed = 0
     tests_failed = 0
-    
-    test_suites = [
-        ("Language Detection", test_language_detection),
-        ("Prompt Formatting", test_prompt_formatting),
-        ("Chat History Formatting", test_chat_history_formatting),
-        ("Query Decomposition", test_query_decomposition),
-        ("Utility Functions", test_utility_functions),
-        ("Rewrite Service Integration", test_rewrite_service_integration),
-        ("Edge Cases", test_edge_cases),
-        ("Performance and Consistency", test_performance_and_consistency),
-        ("Actual Bug Detection", test_actual_bugs),
-    ]
-    
-    for suite_name, test_func in test_suites:
-        try:
-            if asyncio.iscoroutinefunction(test_func):
-                await test_func()
-            else:
-                test_func()
-            tests_passed += 1
-        except Exception as e:
+
+    sync_suites = SYNC_SUITES
+    async_suites = ASYNC_SUITES
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor() as pool:
+        sync_results, async_results = await asyncio.gather(
+            asyncio.gather(
+                *(loop.run_in_executor(pool, func) for _, func in sync_suites),
+                return_exceptions=True,
+            ),
+            asyncio.gather(
+                *(func() for _, func in async_suites),
+                return_exceptions=True,
+            ),
+        )
+
+    outcomes = list(zip(sync_suites, sync_results))
+    outcomes += list(zip(async_suites, async_results))
+
+    for (suite_name, _func), result in outcomes:
+        if isinstance(result, BaseException):
             tests_failed += 1
-            print(f"\n[FAIL] {suite_name}: {e}")
-            import traceback
-            traceback.print_exc()
-    
+            print(f"\n[FAIL] {suite_name}: {result}")
+            traceback.print_exception(
+                type(result), result, result.__traceback__
+            )
+        else:
+            tests_passed += 1
+
     print("\n" + "="*70)
     print("TEST SUMMARY")
     print("="*70)
@@ -3,16 +3,24 @@ from fastapi import Depends, HTTPException
 
 from src.rag_pipeline.retrieval.vectorstore import get_retriever
 
+# Retriever resolvido uma vez e reaproveitado: os parâmetros vêm de
+# settings (estáticos no processo), então não há motivo para refazer a
+# resolução a cada request — só o primeiro acesso paga a construção.
+_retriever = None
+
 
 def retriever_dep():
     """
     FastAPI dependency that returns a ready-to-use retriever.
     Ensures the FAISS vectorstore was initialized at startup.
     """
-    try:
-        return get_retriever()
-    except RuntimeError as e:
-        raise HTTPException(
-            status_code=503,
-            detail="Sistema de busca ainda não está inicializado"
-        ) from e
+    global _retriever
+    if _retriever is None:
+        try:
+            _retriever = get_retriever()
+        except RuntimeError as e:
+            raise HTTPException(
+                status_code=503,
+                detail="Sistema de busca ainda não está inicializado"
+            ) from e
+    return _retriever
@@ -1,15 +1,22 @@
 from typing import List, Optional, Any
+import json
 import logging
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from src.rag_pipeline.pipeline import process_query
+from src.rag_pipeline.pipeline import process_query, process_query_stream
+from src.infra.batcher import QueryBatcher
 from src.infra.cache import clear_history
 
 logger = logging.getLogger("bgo_chatbot.api.chat")
 router = APIRouter()
 
+# Coalesce requisições concorrentes antes do pipeline (ver batcher.py);
+# com CHAT_BATCHING desligado, submit() delega direto ao process_query.
+query_batcher = QueryBatcher(process_query)
+
 
 class ChatRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=2000)  # limite prático
@@ -36,8 +43,8 @@ async def chat_endpoint(req: ChatRequest):
     Recebe uma pergunta (req.question) -> executa o pipeline RAG -> devolve resposta e fontes.
     """
     try:
-        # chama o pipeline (assíncrono)
-        result = await process_query(
+        # chama o pipeline (assíncrono), via batcher quando habilitado
+        result = await query_batcher.submit(
             req.question,
             language=req.language,
             session_id=req.session_id
@@ -70,6 +77,44 @@ async def chat_endpoint(req: ChatRequest):
         raise HTTPException(status_code=500, detail="Erro interno ao processar a requisição.")
 
 
+@router.post("/chat/stream", tags=["chat"])
+async def chat_stream_endpoint(req: ChatRequest):
+    """
+    Variante streaming (SSE) do /chat: envia tokens conforme o LLM
+    gera a resposta, derrubando o time-to-first-token de segundos para
+    centenas de ms. As fontes chegam num evento final `sources`.
+    """
+    async def event_stream():
+        try:
+            async for event in process_query_stream(
+                req.question,
+                language=req.language,
+                session_id=req.session_id,
+            ):
+                if "sources" in event:
+                    yield (
+                        "event: sources\ndata: "
+                        + json.dumps(event["sources"], ensure_ascii=False)
+                        + "\n\n"
+                    )
+                else:
+                    yield (
+                        "data: "
+                        + json.dumps({"token": event["token"]}, ensure_ascii=False)
+                        + "\n\n"
+                    )
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            logger.exception("Erro no /chat/stream: %s", e)
+            yield (
+                "data: "
+                + json.dumps({"error": "Erro interno ao processar a requisição."})
+                + "\n\n"
+            )
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @router.delete("/chat/history/{session_id}", tags=["chat"])
 async def clear_chat_history(session_id: str):
     """
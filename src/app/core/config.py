@@ -1,33 +1,63 @@
-from pydantic_settings import BaseSettings #transform the class in a variable loader
-from pydantic import Field
-from typing import List
+from functools import lru_cache
+
+import json
+from pydantic_settings import BaseSettings, SettingsConfigDict, NoDecode #transform the class in a variable loader
+from pydantic import Field, field_validator
+from typing import Annotated, Tuple
 
 
 
 class Settings(BaseSettings):
-    openai_api_key: str = Field(..., env="OPENAI_API_KEY") #.. means required
-    faiss_index_path: str = Field("data/processed/faiss_index", env="FAISS_INDEX_PATH")
-    max_retrieve: int = Field(6, env="MAX_RETRIEVE")
-    max_rerank: int = Field(4, env="MAX_RERANK")
-    use_reranker: bool = Field(False, env="USE_RERANKER")
-    ALLOWED_ORIGINS: List[str] = Field(default_factory=list)
+    # pydantic-settings v2 casa o nome do campo com a env var
+    # (case-insensitive), dispensando o env= por campo do estilo v1.
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+    )
+
+    openai_api_key: str  # required (OPENAI_API_KEY)
+    faiss_index_path: str = "data/processed/faiss_index"
+    max_retrieve: int = 6
+    max_rerank: int = 4
+    use_reranker: bool = False
+    # Tupla imutável, resolvida uma vez no startup; aceita tanto JSON
+    # quanto lista separada por vírgula na env var (NoDecode deixa o
+    # parse por conta do validator, sem o json.loads automático)
+    ALLOWED_ORIGINS: Annotated[Tuple[str, ...], NoDecode] = Field(default_factory=tuple)
+
+    @field_validator("ALLOWED_ORIGINS", mode="before")
+    @classmethod
+    def _split_origins(cls, value):
+        if isinstance(value, str):
+            stripped = value.strip()
+            if stripped.startswith("["):
+                return json.loads(stripped)
+            return tuple(o.strip() for o in stripped.split(",") if o.strip())
+        return value
+
+    # micro-batching do /chat (desligado por padrão)
+    chat_batching: bool = False
+    max_batch: int = 8
+    batch_window_ms: int = 10
 
     # chunking parameters
-    embedding_model: str = Field("text-embedding-3-large", env="EMBEDDING_MODEL")
-    chunk_size: int = Field(500, env="CHUNK_SIZE")
-    chunk_overlap: int = Field(50, env="CHUNK_OVERLAP")
-    retrieval_score_threshold: float = Field(0.3, env="RETRIEVAL_SCORE_THRESHOLD")
-    retrieval_fetch_k: int = Field(20, env="RETRIEVAL_FETCH_K")
-    support_score_threshold: float = Field(0.12, env="SUPPORT_SCORE_THRESHOLD")
-    bm25_top_accept: int = Field(5, env="BM25_TOP_ACCEPT")
-    max_chunks_per_page: int = Field(2, env="MAX_CHUNKS_PER_PAGE")
+    embedding_model: str = "text-embedding-3-large"
+    chunk_size: int = 500
+    chunk_overlap: int = 50
+    retrieval_score_threshold: float = 0.3
+    retrieval_fetch_k: int = 20
+    support_score_threshold: float = 0.12
+    bm25_top_accept: int = 5
+    max_chunks_per_page: int = 2
 
     # generation parameters
-    generation_model: str = Field("gpt-4o-mini", env="GENERATION_MODEL")
-    generation_temperature: float = Field(0.1, env="GENERATION_TEMPERATURE")
-    
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-
-settings = Settings() #create a global object
\ No newline at end of file
+    generation_model: str = "gpt-4o-mini"
+    generation_temperature: float = 0.1
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Instância única de Settings — o .env é lido uma vez só."""
+    return Settings()
+
+
+settings = get_settings() #create a global object
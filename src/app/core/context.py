@@ -0,0 +1,31 @@
+# src/app/core/context.py
+"""
+Propagação de request-id por contextvars.
+
+Um middleware único (ver main.py) define o id por requisição — lido do
+header X-Request-ID ou gerado uma vez — e qualquer código downstream
+(pipeline, generator, logging) o lê da ContextVar sem precisar passar
+o id por parâmetro.
+"""
+import logging
+import uuid
+from contextvars import ContextVar
+
+REQUEST_ID: ContextVar[str] = ContextVar("request_id", default="-")
+
+
+def get_request_id() -> str:
+    """Request-id corrente (\"-\" fora de uma requisição)."""
+    return REQUEST_ID.get()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    """Anexa o request_id corrente a cada LogRecord."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = REQUEST_ID.get()
+        return True
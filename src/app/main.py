@@ -6,37 +6,114 @@ Main FastAPI app for BGO Chatbot.
 - Registra rotas (src.app.api.v1.chat)
 - Configura CORS, logging e handlers básicos
 """
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse 
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+
+# orjson serializa em C direto para bytes — com ele instalado, todas as
+# respostas usam ORJSONResponse; sem ele, segue o JSONResponse padrão.
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    DefaultResponse = JSONResponse
 
 from src.app.api.v1 import chat
 from src.app.core.config import settings
+from src.app.core.context import REQUEST_ID, RequestIdFilter, new_request_id
+from src.infra.http_client import close_async_http_client
 from src.rag_pipeline.retrieval.vectorstore import init_vectorstore
 
 logger = logging.getLogger("bgo_chatbot")
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(levelname)s:%(name)s:[%(request_id)s] %(message)s",
+)
+# request_id vem da ContextVar via filter — sem re-parse de header
+for _handler in logging.getLogger().handlers:
+    _handler.addFilter(RequestIdFilter())
 DISABLE_RAG_ON_STARTUP = os.getenv("DISABLE_RAG_ON_STARTUP", "false").lower() == "true"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown da app (substitui os @on_event deprecados)."""
+    logger.info("Starting BGO Chatbot API...")
+    # 1️⃣ Validar OpenAI key
+    if not settings.openai_api_key:
+        logger.error("OPENAI_API_KEY não definido.")
+    else:
+        logger.info("OPENAI_API_KEY carregada.")
+
+    # 2️⃣ Inicializar FAISS (OBRIGATÓRIO)
+    try:
+        logger.info(
+            "Inicializando vectorstore (FAISS) em: %s",
+            settings.faiss_index_path
+        )
+        # Load do índice é bloqueante (I/O + desserialização): roda num
+        # thread para o event loop continuar atendendo liveness pings.
+        await asyncio.to_thread(init_vectorstore, settings.faiss_index_path)
+        app.state.vectorstore_ready = True
+        logger.info("Vectorstore inicializado com sucesso.")
+    except FileNotFoundError as e:
+        logger.error("FAISS index não encontrado: %s", e)
+        raise RuntimeError("FAISS index obrigatório para rodar o chatbot")
+    except Exception as e:
+        logger.exception("Erro ao inicializar vectorstore")
+        raise
+
+    # 3️⃣ Batcher do /chat (no-op se CHAT_BATCHING desligado)
+    chat.query_batcher.start()
+
+    yield
+
+    await chat.query_batcher.stop()
+    await close_async_http_client()
+
+
 def create_app() -> FastAPI:
     app = FastAPI(
         title="BGO Chatbot API",
         description="Backend API for the Brazilian Geography Olympiad Chatbot (RAG pipeline)",
         version="0.1.0",
+        default_response_class=DefaultResponse,
+        lifespan=lifespan,
     )
 
     # CORS (ajuste origns - when the chatbot is publish online)
     app.add_middleware(
         CORSMiddleware,
-        allow_origins= settings.ALLOWED_ORIGINS,
+        allow_origins=list(settings.ALLOWED_ORIGINS),  # starlette espera lista
         allow_credentials=True,
-        allow_methods=["POST", "OPTIONS"],
-        allow_headers=["*"],
+        allow_methods=["POST", "DELETE", "OPTIONS"],
+        # Headers explícitos em vez de "*": o preflight fica cacheável
+        # e não autoriza headers que a API nem usa
+        allow_headers=["Content-Type", "Authorization", "X-Request-ID"],
     )
 
+    # Respostas do /chat carregam snippets de regulamento que comprimem
+    # muito bem; nível 5 equilibra CPU x razão de compressão.
+    app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
+    # Request-id: definido uma vez por requisição na ContextVar e
+    # devolvido no header da resposta (tracing ponta a ponta)
+    @app.middleware("http")
+    async def request_id_middleware(request: Request, call_next):
+        rid = request.headers.get("X-Request-ID") or new_request_id()
+        token = REQUEST_ID.set(rid)
+        try:
+            response = await call_next(request)
+        finally:
+            REQUEST_ID.reset(token)
+        response.headers["X-Request-ID"] = rid
+        return response
+
     #Include API router
     app.include_router(chat.router, prefix="/api/v1")
 
@@ -46,49 +123,23 @@ def create_app() -> FastAPI:
         return {"status": "ok"}
     
     @app.get("/ready", tags=["health"])
-    async def ready():
-        #check if the vectorstore is loading
-        try:
-            # lazy check: se init_vectorstore levantou exceção na startup,
-            # a app provavelmente não está pronta — então respondemos conforme.
-            return {"ready": True}
-        except Exception:
-            return {"ready": False}
+    async def ready(request: Request):
+        # Probe real: o flag só vira True quando init_vectorstore
+        # conclui na startup; antes disso devolvemos 503 para o
+        # balanceador não rotear tráfego que vai falhar no retriever.
+        if not getattr(request.app.state, "vectorstore_ready", False):
+            return DefaultResponse(status_code=503, content={"ready": False})
+        return {"ready": True}
 
     # Global exception handler (retorna JSON com mensagem curta)
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc:Exception):
         logger.exception("Unhandled error: %s", exc)
-        return JSONResponse(
+        return DefaultResponse(
             status_code=500,
             content={"detail":"Internal server error"}
         )
     
-    # Startup: inicializa recursos pesados
-    @app.on_event("startup")
-    async def on_startup():
-        logger.info("Starting BGO Chatbot API...")
-        # 1️⃣ Validar OpenAI key
-        if not settings.openai_api_key:
-            logger.error("OPENAI_API_KEY não definido.")
-        else:
-            logger.info("OPENAI_API_KEY carregada.")
-
-        # 2️⃣ Inicializar FAISS (OBRIGATÓRIO)
-        try:
-            logger.info(
-                "Inicializando vectorstore (FAISS) em: %s",
-                settings.faiss_index_path
-            )
-            init_vectorstore(settings.faiss_index_path)
-            logger.info("Vectorstore inicializado com sucesso.")
-        except FileNotFoundError as e:
-            logger.error("FAISS index não encontrado: %s", e)
-            raise RuntimeError("FAISS index obrigatório para rodar o chatbot")
-        except Exception as e:
-            logger.exception("Erro ao inicializar vectorstore")
-            raise
-    
     return app
 
 app = create_app()
\ No newline at end of file
@@ -1,5 +1,5 @@
 from typing import List, Optional
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, field_validator
 
 
 class ChatMessage(BaseModel):
@@ -53,7 +53,8 @@ class ChatRequest(BaseModel):
         description="ID único da requisição (debug, tracing, logs)"
     )
 
-    @validator("chat_history", pre=True)
+    @field_validator("chat_history", mode="before")
+    @classmethod
     def limit_chat_history(cls, value):
         """
         Limita o tamanho do histórico para evitar contextos gigantes
@@ -0,0 +1,123 @@
+# src/infra/batcher.py
+"""
+Micro-batching de requisições do /chat.
+
+Requisições concorrentes que chegam dentro de uma janela curta são
+coalescidas em um lote e despachadas juntas, em vez de cada request
+disparar o pipeline isoladamente. O lote é processado com um único
+asyncio.gather, o que agrupa as chamadas de embedding/LLM no tempo e
+limita o fan-out simultâneo a MAX_BATCH.
+
+Desligado por padrão (CHAT_BATCHING) — só compensa sob carga
+concorrente real; com tráfego esparso a janela apenas adiciona latência.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from src.app.core.config import settings
+
+logger = logging.getLogger("bgo_chatbot.batcher")
+
+
+class QueryBatcher:
+    """Fila + worker que coalesce perguntas concorrentes em lotes.
+
+    O worker espera a janela (batch_window_ms) por companheiros de lote,
+    até max_batch itens, e resolve o future de cada requisição com o
+    resultado do handler. Com batching desligado, submit() delega
+    direto ao handler, sem fila nem janela.
+    """
+
+    def __init__(self, handler) -> None:
+        self._handler = handler
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        # Lotes em voo: referências fortes para as tasks de dispatch não
+        # serem coletadas antes de terminar.
+        self._inflight: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.chat_batching and self._worker is not None
+
+    def start(self) -> None:
+        """Inicia o worker de lote (chamar no startup da app)."""
+        if settings.chat_batching and self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._drain())
+            logger.info(
+                "Query batcher ativo (max_batch=%d, window=%dms)",
+                settings.max_batch, settings.batch_window_ms,
+            )
+
+    async def stop(self) -> None:
+        """Encerra o worker (chamar no shutdown da app)."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(
+        self,
+        question: str,
+        language: str = "pt",
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        if not self.enabled:
+            return await self._handler(
+                question, language=language, session_id=session_id
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((question, language, session_id, future))
+        return await future
+
+    async def _drain(self) -> None:
+        loop = asyncio.get_running_loop()
+        window_s = settings.batch_window_ms / 1000.0
+        while True:
+            item = await self._queue.get()
+            batch = [item]
+
+            # Janela de coalescência: espera alguns ms por mais itens
+            deadline = loop.time() + window_s
+            while len(batch) < settings.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            if len(batch) > 1:
+                logger.debug("Dispatching batch of %d queries", len(batch))
+            # Despacho em task separada: o worker volta imediatamente a
+            # coletar a fila em vez de segurar os próximos pedidos atrás
+            # do pipeline inteiro (segundos) do lote anterior. O gather
+            # com return_exceptions dentro do dispatch já isola falhas
+            # por item.
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list) -> None:
+        results = await asyncio.gather(
+            *(
+                self._handler(question, language=language, session_id=session_id)
+                for question, language, session_id, _ in batch
+            ),
+            return_exceptions=True,
+        )
+        for (_, _, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,49 +1,131 @@
 """
 Chat history management for conversation sessions.
 
-This module provides a simple in-memory storage for chat history.
-For production, consider upgrading to Redis or a database.
+This module provides storage for chat history. With REDIS_URL set (and
+the redis package installed), history lives in Redis per-session lists
+with native TTL eviction — O(1) expiry handled by the server, shared
+across uvicorn workers. Otherwise it falls back to the original
+process-local in-memory dict, so dev mode keeps working without extra
+infrastructure.
 
 Each session maintains a conversation history as a list of (question, answer) pairs.
 """
 
+import heapq
+import json
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import islice
 from typing import List, Tuple, Optional, Dict
-from datetime import datetime, timedelta
 import logging
 
-logger = logging.getLogger("bgo_chatbot.cache")
+# redis é opcional: sem o pacote (ou sem REDIS_URL) usamos o dict local.
+try:
+    import redis
+except ImportError:
+    redis = None
 
-# In-memory storage: session_id -> List[Tuple[question, answer, timestamp]]
-_chat_history: Dict[str, List[Tuple[str, str, datetime]]] = {}
+logger = logging.getLogger("bgo_chatbot.cache")
 
 # Session expiry time (default: 24 hours)
 SESSION_EXPIRY_HOURS = 24
+_EXPIRY_SECONDS = SESSION_EXPIRY_HOURS * 3600
+
+# Limite de turnos por sessão: maxlen do ring em memória e LTRIM no
+# Redis. get_history só lê os últimos 5, então reter mais que isso é
+# memória parada. Lido da env para o módulo seguir importável sozinho.
+MAX_HISTORY_TURNS = int(os.getenv("MAX_HISTORY_TURNS", "32"))
+
+
+@dataclass
+class SessionRing:
+    """Sessão em layout SoA: deques paralelos de perguntas/respostas/
+    timestamps. O maxlen faz o papel de ring buffer — turnos antigos
+    caem sozinhos, sem trim manual — e get_history só zipa dois deques,
+    sem desempacotar tuplas por turno."""
+    questions: deque = field(default_factory=lambda: deque(maxlen=MAX_HISTORY_TURNS))
+    answers: deque = field(default_factory=lambda: deque(maxlen=MAX_HISTORY_TURNS))
+    timestamps: deque = field(default_factory=lambda: deque(maxlen=MAX_HISTORY_TURNS))
+
+
+# In-memory storage: session_id -> SessionRing (epoch floats nos
+# timestamps: entrada menor e comparação direta na expiração)
+_chat_history: Dict[str, SessionRing] = {}
+
+_KEY_PREFIX = "chat_history:"
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+_redis = None
+if redis is not None and REDIS_URL:
+    try:
+        _redis = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+        _redis.ping()
+        logger.info("Chat history backed by Redis (%s)", REDIS_URL)
+    except Exception as e:
+        logger.warning("Redis indisponível (%s); usando histórico em memória", e)
+        _redis = None
+
+
+def _session_key(session_id: str) -> str:
+    return _KEY_PREFIX + session_id
+
+
+# LRU curto na frente do Redis para o histórico formatado: sessões
+# ativas fazem 1 leitura por turno, e 60s de TTL poupam essa ida ao
+# servidor sem servir histórico velho por muito tempo. A escrita
+# invalida a entrada, então dentro da MESMA sessão nunca há atraso.
+# Só usado no backend Redis — o fallback em memória já é local.
+_HISTORY_LRU_TTL_S = 60
+_HISTORY_LRU_MAX_ENTRIES = 10_000
+# session_id -> (expiry_ts, max_turns, histórico formatado)
+_history_lru: Dict[str, Tuple[float, int, str]] = {}
+
+
+# Min-heap de (expiry_ts, session_id) + última expiração válida por
+# sessão: a limpeza só toca sessões realmente vencidas (O(log N) por
+# pop) em vez de varrer o dict inteiro a cada escrita. Entradas velhas
+# no heap (sessão tocada de novo depois) são detectadas comparando com
+# _session_expiry e simplesmente descartadas.
+_expiry_heap: List[Tuple[float, str]] = []
+_session_expiry: Dict[str, float] = {}
+
+# Roda a limpeza no máximo uma vez por segundo
+_CLEANUP_INTERVAL_S = 1.0
+_next_cleanup = 0.0
+
+
+def _touch_session(session_id: str) -> None:
+    """Registra/renova a expiração de uma sessão no heap."""
+    expiry = time.time() + _EXPIRY_SECONDS
+    _session_expiry[session_id] = expiry
+    heapq.heappush(_expiry_heap, (expiry, session_id))
 
 
 def _cleanup_expired_sessions():
     """Remove expired sessions from memory."""
-    now = datetime.now()
-    expired_sessions = []
-    
-    for session_id, history in _chat_history.items():
-        if not history:
-            expired_sessions.append(session_id)
-            continue
-            
-        # Check if last interaction is expired
-        last_interaction_time = history[-1][2]
-        if now - last_interaction_time > timedelta(hours=SESSION_EXPIRY_HOURS):
-            expired_sessions.append(session_id)
-    
-    for session_id in expired_sessions:
-        del _chat_history[session_id]
-        logger.debug(f"Removed expired session: {session_id}")
+    global _next_cleanup
+
+    now = time.time()
+    if now < _next_cleanup:
+        return
+    _next_cleanup = now + _CLEANUP_INTERVAL_S
+
+    while _expiry_heap and _expiry_heap[0][0] <= now:
+        expiry, session_id = heapq.heappop(_expiry_heap)
+        # Entrada do heap só vale se for a expiração mais recente
+        if _session_expiry.get(session_id) == expiry:
+            _chat_history.pop(session_id, None)
+            del _session_expiry[session_id]
+            logger.debug(f"Removed expired session: {session_id}")
 
 
 def add_to_history(session_id: str, question: str, answer: str) -> None:
     """
     Add a question-answer pair to the chat history for a session.
-    
+
     Args:
         session_id: Unique identifier for the conversation session
         question: User's question
@@ -51,84 +133,178 @@ def add_to_history(session_id: str, question: str, answer: str) -> None:
     """
     if not session_id:
         return
-    
+
+    if _redis is not None:
+        key = _session_key(session_id)
+        # RPUSH + LTRIM + EXPIRE num pipeline só (uma ida ao servidor);
+        # a expiração fica por conta do Redis, sem scan no hot path.
+        pipe = _redis.pipeline()
+        pipe.rpush(key, json.dumps(
+            [question, answer, time.time()]
+        ))
+        pipe.ltrim(key, -MAX_HISTORY_TURNS, -1)
+        pipe.expire(key, SESSION_EXPIRY_HOURS * 3600)
+        pipe.execute()
+        _history_lru.pop(session_id, None)
+        return
+
     _cleanup_expired_sessions()
-    
-    if session_id not in _chat_history:
-        _chat_history[session_id] = []
-    
-    _chat_history[session_id].append((question, answer, datetime.now()))
-    logger.debug(f"Added to history for session {session_id}: {len(_chat_history[session_id])} messages")
+
+    ring = _chat_history.get(session_id)
+    if ring is None:
+        ring = _chat_history[session_id] = SessionRing()
+
+    _touch_session(session_id)
+    ring.questions.append(question)
+    ring.answers.append(answer)
+    ring.timestamps.append(time.time())
+    logger.debug(f"Added to history for session {session_id}: {len(ring.questions)} messages")
+
+
+def _get_turns(session_id: Optional[str], max_turns: int) -> List[Tuple[str, str]]:
+    """Últimos max_turns pares (pergunta, resposta) de uma sessão."""
+    if not session_id:
+        return []
+
+    if _redis is not None:
+        raw = _redis.lrange(_session_key(session_id), -max_turns, -1)
+        return [tuple(json.loads(item)[:2]) for item in raw]
+
+    ring = _chat_history.get(session_id)
+    if ring is None:
+        return []
+
+    start = max(0, len(ring.questions) - max_turns)
+    return list(islice(zip(ring.questions, ring.answers), start, None))
 
 
 def get_history(session_id: Optional[str], max_turns: int = 5) -> str:
     """
     Retrieve chat history for a session, formatted as a string.
-    
+
     Args:
         session_id: Unique identifier for the conversation session
         max_turns: Maximum number of recent turns to include (default: 5)
-        
+
     Returns:
         Formatted chat history string, or empty string if no history exists
     """
-    if not session_id or session_id not in _chat_history:
-        return ""
-    
-    _cleanup_expired_sessions()
-    
-    history = _chat_history[session_id]
-    if not history:
+    if _redis is None:
+        if not session_id or session_id not in _chat_history:
+            return ""
+        _cleanup_expired_sessions()
+    elif session_id:
+        entry = _history_lru.get(session_id)
+        if entry is not None and entry[0] > time.time() and entry[1] == max_turns:
+            return entry[2]
+
+    turns = _get_turns(session_id, max_turns)
+    if not turns:
         return ""
-    
-    # Get last N turns
-    recent_history = history[-max_turns:] if len(history) > max_turns else history
-    
+
     # Format as Q/A pairs
     formatted_parts = []
-    for question, answer, _ in recent_history:
+    for question, answer in turns:
         formatted_parts.append(f"Q: {question}")
         formatted_parts.append(f"A: {answer}")
-    
-    return "\n".join(formatted_parts)
+
+    formatted = "\n".join(formatted_parts)
+
+    if _redis is not None and session_id:
+        if len(_history_lru) >= _HISTORY_LRU_MAX_ENTRIES:
+            _history_lru.pop(next(iter(_history_lru)))
+        _history_lru[session_id] = (time.time() + _HISTORY_LRU_TTL_S, max_turns, formatted)
+
+    return formatted
 
 
 def clear_history(session_id: str) -> None:
     """
     Clear chat history for a specific session.
-    
+
     Args:
         session_id: Unique identifier for the conversation session
     """
+    if _redis is not None:
+        _redis.delete(_session_key(session_id))
+        _history_lru.pop(session_id, None)
+        return
+
     if session_id in _chat_history:
         del _chat_history[session_id]
+        # entradas órfãs no heap são ignoradas pela limpeza
+        _session_expiry.pop(session_id, None)
         logger.debug(f"Cleared history for session {session_id}")
 
 
 def get_history_list(session_id: Optional[str], max_turns: int = 5) -> List[Tuple[str, str]]:
     """
     Retrieve chat history as a list of (question, answer) tuples.
-    
+
     Args:
         session_id: Unique identifier for the conversation session
         max_turns: Maximum number of recent turns to include
-        
+
     Returns:
         List of (question, answer) tuples
     """
-    if not session_id or session_id not in _chat_history:
-        return []
-    
-    history = _chat_history[session_id]
-    if not history:
-        return []
-    
-    recent_history = history[-max_turns:] if len(history) > max_turns else history
-    return [(q, a) for q, a, _ in recent_history]
+    return _get_turns(session_id, max_turns)
+
+
+# ------------------------------------------------------------------
+# Cache de respostas geradas (ver answer_service): chave content-addressed
+# -> JSON serializado. Usa o mesmo Redis do histórico quando disponível
+# (SETEX nativo); senão, dict local com expiração preguiçosa.
+# ------------------------------------------------------------------
+
+ANSWER_CACHE_TTL_S = 3600
+_ANSWER_KEY_PREFIX = "answer_cache:"
+_ANSWER_CACHE_MAX_ENTRIES = 1024
+
+# key -> (expiry_ts, payload)
+_answer_cache: Dict[str, Tuple[float, str]] = {}
+
+
+def get_cached_answer(key: str) -> Optional[str]:
+    """Busca uma resposta cacheada; None em miss ou expirada."""
+    if _redis is not None:
+        return _redis.get(_ANSWER_KEY_PREFIX + key)
+
+    entry = _answer_cache.get(key)
+    if entry is None:
+        return None
+    expiry, payload = entry
+    if expiry <= time.time():
+        del _answer_cache[key]
+        return None
+    # Reinsere no fim: a ordem do dict vira ordem de uso e a evicção
+    # descarta o menos usado recentemente (LRU), não o mais antigo.
+    _answer_cache[key] = _answer_cache.pop(key)
+    return payload
+
+
+def cache_answer(key: str, payload: str, ttl_s: int = ANSWER_CACHE_TTL_S) -> None:
+    """Guarda uma resposta serializada com TTL."""
+    if _redis is not None:
+        _redis.setex(_ANSWER_KEY_PREFIX + key, ttl_s, payload)
+        return
+
+    # Mantém o cache local limitado: expira vencidas e, se ainda cheio,
+    # descarta as entradas menos usadas (início do dict na ordem LRU).
+    if len(_answer_cache) >= _ANSWER_CACHE_MAX_ENTRIES:
+        now = time.time()
+        for k in [k for k, (exp, _) in _answer_cache.items() if exp <= now]:
+            del _answer_cache[k]
+        while len(_answer_cache) >= _ANSWER_CACHE_MAX_ENTRIES:
+            _answer_cache.pop(next(iter(_answer_cache)))
+
+    _answer_cache[key] = (time.time() + ttl_s, payload)
 
 
 def get_session_count() -> int:
     """Get the number of active sessions."""
+    if _redis is not None:
+        return sum(1 for _ in _redis.scan_iter(match=_KEY_PREFIX + "*"))
+
     _cleanup_expired_sessions()
     return len(_chat_history)
-
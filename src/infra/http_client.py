@@ -0,0 +1,37 @@
+# src/infra/http_client.py
+"""
+Cliente HTTP assíncrono compartilhado pelas chamadas OpenAI.
+
+Cada ChatOpenAI criado sem cliente explícito monta o próprio
+httpx.AsyncClient com limites default — sob concorrência isso gera
+churn de conexões/handshakes TLS. Um pool único com keep-alive
+dimensionado elimina o setup de conexão do hot path.
+"""
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger("bgo_chatbot.http")
+
+# Pool compartilhado: conexões suficientes para o fan-out de
+# rewrite + geração concorrentes, com keep-alive generoso.
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Cliente singleton (lazy) usado por todos os LLMs do processo."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(limits=_LIMITS)
+    return _client
+
+
+async def close_async_http_client() -> None:
+    """Fecha o pool (chamar no shutdown da app)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
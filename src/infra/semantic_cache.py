@@ -0,0 +1,186 @@
+"""
+Semantic answer cache for the RAG pipeline.
+
+Perguntas semanticamente idênticas ("quem pode participar?" /
+"quais alunos podem se inscrever?") produzem a mesma resposta, mas o
+cache content-addressed só acerta em texto idêntico. Aqui a chave é o
+embedding da pergunta reescrita: o lookup compara por cosseno contra os
+embeddings das respostas anteriores (produto de matriz no numpy, uma
+chamada BLAS) e devolve a resposta guardada quando a similaridade passa
+do threshold — pulando retrieval e geração inteiros.
+
+Fica em memória de processo: os vetores são pequenos (N ≤ 256) e o
+lookup precisa da matriz inteira de qualquer forma, então não há ganho
+em externalizar para o Redis como no histórico de sessões.
+"""
+
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# numpy chega junto com faiss/langchain; o guard mantém o módulo
+# importável em ambientes mínimos (cache vira no-op).
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger("bgo_chatbot.semantic_cache")
+
+# numba é opcional: com ele o lookup usa um kernel que funde produto
+# interno, threshold e argmax numa passada paralela só — sem os arrays
+# temporários do caminho numpy (matriz @ vetor + argmax separados).
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _top1_above(matrix_q, scales, query_q, query_scale, threshold):  # pragma: no cover - compilado
+        n = matrix_q.shape[0]
+        d = matrix_q.shape[1]
+        scores = np.empty(n, dtype=np.float32)
+        for i in numba.prange(n):
+            acc = np.int32(0)
+            for j in range(d):
+                acc += np.int32(matrix_q[i, j]) * np.int32(query_q[j])
+            scores[i] = np.float32(acc) * scales[i] * query_scale
+        # Argmax condicional não é uma redução suportada pelo prange;
+        # o passo serial sobre N floats é desprezível perto dos dots.
+        best_index = -1
+        best_score = np.float32(-2.0)
+        for i in range(n):
+            if scores[i] > best_score:
+                best_score = scores[i]
+                best_index = i
+        if best_score < threshold:
+            return -1
+        return best_index
+else:
+    _top1_above = None
+
+# Threshold alto de propósito: abaixo disso perguntas diferentes sobre
+# o mesmo tema (fase online x presencial) colidiriam.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL_S = int(os.getenv("SEMANTIC_CACHE_TTL_S", "3600"))
+_MAX_ENTRIES = 256
+
+_ENABLED = os.getenv("SEMANTIC_CACHE", "true").lower() in ("1", "true", "yes")
+
+
+class SemanticCache:
+    """Par (matriz de embeddings quantizados, lista de resultados).
+
+    A matriz [N, d] e a lista andam em paralelo: a linha i corresponde
+    ao resultado i. As linhas são int8 com escala por linha (simétrica,
+    max-abs): 1/4 da banda de memória do float32 no lookup — que é
+    memory-bound — preservando o ranking de cosseno em ~1e-3. Evicção
+    por TTL (purga preguiçosa) e por tamanho (descarta a entrada mais
+    antiga quando cheio).
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_s: int = SEMANTIC_CACHE_TTL_S,
+        max_entries: int = _MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._matrix = None  # np.ndarray int8 [N, d], linhas quantizadas
+        self._scales = None  # np.ndarray float32 [N], escala por linha
+        self._entries: List[Tuple[float, Dict[str, Any]]] = []  # (expiry, result)
+
+    @property
+    def enabled(self) -> bool:
+        return _ENABLED and np is not None
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        if not any(expiry <= now for expiry, _ in self._entries):
+            return
+        keep = [i for i, (expiry, _) in enumerate(self._entries) if expiry > now]
+        self._entries = [self._entries[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+        self._scales = self._scales[keep] if keep else None
+
+    @staticmethod
+    def _normalize(embedding) -> Optional["np.ndarray"]:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return None
+        return vec / norm
+
+    @staticmethod
+    def _quantize(vec: "np.ndarray") -> Tuple["np.ndarray", float]:
+        """Quantização simétrica por max-abs: vec ≈ q * scale."""
+        max_abs = float(np.max(np.abs(vec)))
+        if max_abs == 0:
+            return vec.astype(np.int8), 0.0
+        scale = max_abs / 127.0
+        return np.round(vec / scale).astype(np.int8), scale
+
+    def lookup(self, embedding) -> Optional[Dict[str, Any]]:
+        """Resultado mais similar acima do threshold, ou None."""
+        if not self.enabled or self._matrix is None:
+            return None
+        self._purge_expired()
+        if self._matrix is None:
+            return None
+        vec = self._normalize(embedding)
+        if vec is None:
+            return None
+        query_q, query_scale = self._quantize(vec)
+        if _top1_above is not None:
+            best = int(
+                _top1_above(
+                    np.ascontiguousarray(self._matrix),
+                    self._scales,
+                    query_q,
+                    np.float32(query_scale),
+                    np.float32(self.threshold),
+                )
+            )
+            if best < 0:
+                return None
+        else:
+            # int8 puro estouraria no acumulador do matmul; int32 de um
+            # lado promove a acumulação inteira para 32 bits.
+            raw = self._matrix.astype(np.int32) @ query_q.astype(np.int32)
+            scores = raw.astype(np.float32) * self._scales * np.float32(query_scale)
+            best = int(np.argmax(scores))
+            if float(scores[best]) < self.threshold:
+                return None
+        # Cópia rasa: o chamador não deve mutar a entrada cacheada
+        return dict(self._entries[best][1])
+
+    def add(self, embedding, result: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        vec = self._normalize(embedding)
+        if vec is None:
+            return
+        self._purge_expired()
+        if len(self._entries) >= self.max_entries:
+            self._entries.pop(0)
+            self._matrix = self._matrix[1:]
+            self._scales = self._scales[1:]
+        row_q, scale = self._quantize(vec)
+        row = row_q.reshape(1, -1)
+        scale_arr = np.array([scale], dtype=np.float32)
+        if self._matrix is None:
+            self._matrix = row
+            self._scales = scale_arr
+        else:
+            self._matrix = np.vstack((self._matrix, row))
+            self._scales = np.concatenate((self._scales, scale_arr))
+        self._entries.append((time.time() + self.ttl_s, dict(result)))
+
+
+# Instância única do processo (mesmo padrão do answer cache)
+semantic_cache = SemanticCache()
@@ -1,21 +1,122 @@
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import io
+import json
 import logging
+import os
 import re
 
+import openai
 from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 
 from .templates import (
-    SYSTEM_PROMPT,
+    SYSTEM_PROMPT_STATIC,
+    SYSTEM_PROMPT_LANG_SUFFIX,
     ANSWER_TEMPLATE,
     FALLBACK_RESPONSE,
 )
 from src.app.core.config import settings
+from src.infra.cache import get_cached_answer, cache_answer
+from src.infra.http_client import get_async_http_client
 
 logger = logging.getLogger("bgo_chatbot.generator")
 
+# Teto por trecho no contexto do gerador: chunks vêm do splitter com
+# ~500 chars, então 1000 só corta outliers, não conteúdo normal.
+_MAX_SNIPPET_CHARS = 1000
+
+# Acima disso a montagem do contexto sai do event loop (to_thread):
+# alguns ms de trabalho síncrono de string travariam os outros requests.
+_CONTEXT_TO_THREAD_CHARS = 32 * 1024
+
+# Regexes do caminho quente compiladas uma vez no load do módulo — os
+# re.sub/re.search com string literal pagavam lookup no cache interno
+# do re a cada resposta.
+# Gatilhos de trailer de citação (sempre frases fixas em minúsculas):
+# str.find em C sobre a resposta lower-cased sai mais barato que o
+# motor de regex para strings deste tamanho. O corte vai do primeiro
+# gatilho encontrado até o fim, como fazia a alternação com DOTALL.
+_TRAILER_MARKERS = (
+    "você pode encontrar",
+    "encontre mais em",
+    "consulte:",
+    "fonte:",
+    "fontes:",
+    "referência:",
+)
+_RESPOSTA_PREFIX = "resposta:"
+# Sufixo de idioma formatado uma vez por código (cardinalidade
+# minúscula: pt-BR/en/es...) — lookup O(1) em vez de str.format por
+# request.
+_LANG_SUFFIX_CACHE: Dict[str, str] = {}
+
+
+def _system_suffix_for(language: str) -> str:
+    return _LANG_SUFFIX_CACHE.setdefault(
+        language, SYSTEM_PROMPT_LANG_SUFFIX.format(language=language)
+    )
+
+
+_PATH_PREFIX_RE = re.compile(r"^(?:data[/\\]raw[/\\]|data[/\\])")
+_ITEM_RE = re.compile(r"\b\d+(?:\.\d+){1,3}\b")
+_ONLINE_RE = re.compile(r"\bonline\b|fases?\s+on-?line")
+
+
+# Teto de chamadas simultâneas ao LLM: acima disso o endpoint começa a
+# devolver 429 e os retries serializam tudo. Criado preguiçosamente
+# porque o Semaphore precisa nascer já com um loop rodando.
+_LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+_llm_semaphore: Optional[asyncio.Semaphore] = None
+_llm_semaphore_loop = None
+
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    global _llm_semaphore, _llm_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _llm_semaphore is None or _llm_semaphore_loop is not loop:
+        _llm_semaphore = asyncio.Semaphore(_LLM_MAX_CONCURRENCY)
+        _llm_semaphore_loop = loop
+    return _llm_semaphore
+
+
+# Labels [Fonte N: ...] prontos por (posição, fonte, página, fase): num
+# corpus fixo de regulamento as combinações se repetem entre queries,
+# então o f-string vira lookup. Limite folgado só para não crescer sem
+# teto se os metadados variarem.
+_LABEL_CACHE: Dict[tuple, str] = {}
+_LABEL_CACHE_MAX_ENTRIES = 1024
+
+
+def _context_label(idx: int, source_clean: str, page, phase: str) -> str:
+    key = (idx, source_clean, page, phase)
+    label = _LABEL_CACHE.get(key)
+    if label is None:
+        if len(_LABEL_CACHE) >= _LABEL_CACHE_MAX_ENTRIES:
+            _LABEL_CACHE.pop(next(iter(_LABEL_CACHE)))
+        label = _LABEL_CACHE[key] = (
+            f"[Fonte {idx}: {source_clean}-pag{page} | aplica-se a: {phase}]\n"
+        )
+    return label
+
+
+def _strip_ext(name: str) -> str:
+    """Remove a extensão conhecida do nome da fonte.
+
+    removesuffix é O(len do sufixo) e só aloca quando há match, ao
+    contrário do par de str.replace que varria a string toda duas vezes.
+    """
+    return name.removesuffix(".pdf").removesuffix(".txt")
+
 
 class AnswerService:
     """
@@ -35,15 +136,37 @@ class AnswerService:
                 else getattr(settings, "generation_temperature", 0.1)
             ),
             request_timeout=30,
-            max_tokens=300,
+            # A resposta pedida tem 2-3 frases curtas; 160 tokens dão
+            # folga para isso sem pagar cauda de latência por headroom.
+            max_tokens=160,
+            # pool httpx compartilhado: sem handshake TCP/TLS por request
+            http_async_client=get_async_http_client(),
         )
 
-        self.prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_PROMPT),
-                ("human", ANSWER_TEMPLATE),
-            ]
-        )
+    @staticmethod
+    def _build_messages(
+        question: str,
+        context: str,
+        language: str,
+        chat_history: str
+    ) -> list:
+        """Monta as mensagens com str.format direto nos templates.
+
+        Os templates são strings estáticas — formatar direto evita o
+        re-parse/validação do ChatPromptTemplate a cada request. O
+        bloco de sistema estático vai numa mensagem própria, idêntica
+        em todo request, para o prompt cache do provedor aproveitar o
+        prefixo; só o sufixo minúsculo de idioma é formatado.
+        """
+        return [
+            ("system", SYSTEM_PROMPT_STATIC),
+            ("system", _system_suffix_for(language)),
+            ("human", ANSWER_TEMPLATE.format(
+                question=question,
+                context=context,
+                chat_history=chat_history or "(sem histórico)",
+            )),
+        ]
 
     async def generate_answer(
         self,
@@ -68,20 +191,28 @@ class AnswerService:
                 "sources": []
             }
 
+        # Cache content-addressed: mesma pergunta normalizada + mesmos
+        # docs = mesma resposta, sem gastar tokens de novo. Respostas
+        # dependentes de histórico não são cacheadas (contexto muda).
+        cache_key = None
+        if not chat_history:
+            cache_key = self._answer_cache_key(question, documents, language)
+            cached = get_cached_answer(cache_key)
+            if cached is not None:
+                logger.info("Answer cache hit")
+                return json.loads(cached)
+
         try:
             # Build context with source labels for the LLM
-            context = self._build_context_with_labels(documents)
+            records = self._prepare_source_records(documents)
+            context = await self._assemble_context(records)
             
             logger.debug("Generating answer with %d documents", len(documents))
             
-            response = await self.llm.ainvoke(
-                self.prompt.format_messages(
-                    question=question,
-                    context=context,
-                    language=language,
-                    chat_history=chat_history or "(sem histórico)",
+            async with _get_llm_semaphore():
+                response = await self._invoke_llm(
+                    self._build_messages(question, context, language, chat_history)
                 )
-            )
 
             answer_text = response.content
             
@@ -94,24 +225,113 @@ class AnswerService:
             if self._is_abstention(answer_text):
                 sources = []
             else:
-                sources = self._extract_sources(documents)
+                sources = self._extract_sources(records)
 
             # Ensure answer has citations in the correct format
             answer_with_citations = self._ensure_citations(answer_text, sources)
             
-            logger.info("Successfully generated answer (len=%d chars) with %d sources", 
-                       len(answer_with_citations), len(sources))
+            # Guard: os len() dos argumentos seriam computados mesmo com
+            # INFO desligado; com o nível checado antes, não custam nada.
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Successfully generated answer (len=%d chars) with %d sources",
+                            len(answer_with_citations), len(sources))
             
-            return {
+            result = {
                 "answer": answer_with_citations,
                 "sources": sources
             }
 
+            if cache_key is not None:
+                cache_answer(cache_key, json.dumps(result, ensure_ascii=False))
+
+            return result
+
         except Exception as e:
             logger.exception("Error during answer generation: %s", e)
             # Re-raise to allow pipeline retry logic to handle it
             raise
 
+    # Retry granular só na chamada remota (rate limit/timeout): o
+    # pipeline não tem mais retry externo, então refazer a geração aqui
+    # não replica rewrite/retrieval/rerank.
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(min=1, max=4),
+        retry=retry_if_exception_type(
+            (openai.RateLimitError, openai.APITimeoutError)
+        ),
+        reraise=True,
+    )
+    async def _invoke_llm(self, messages):
+        return await self.llm.ainvoke(messages)
+
+    @staticmethod
+    def _answer_cache_key(
+        question: str,
+        documents: List[Document],
+        language: str
+    ) -> str:
+        """Chave content-addressed: pergunta normalizada + idioma + docs."""
+        doc_ids = sorted({
+            str((doc.metadata or {}).get("chunk_id")
+                or f"{(doc.metadata or {}).get('source')}:{(doc.metadata or {}).get('page')}")
+            for doc in documents
+        })
+        raw = "|".join([question.lower().strip(), language, *doc_ids])
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    async def stream_answer(
+        self,
+        question: str,
+        documents: List[Document],
+        language: str = "pt-BR",
+        chat_history: str = ""
+    ):
+        """
+        Streaming variant of generate_answer: yields {"token": str}
+        events as the LLM produces content, then a final
+        {"sources": [...]} event once the full answer is known.
+
+        Tokens já emitidos não passam pelo _ensure_citations (não dá
+        para limpar texto que o cliente já recebeu); a decisão de
+        abstenção usa a resposta completa acumulada.
+        """
+        if not documents:
+            logger.warning("No documents provided for answer generation")
+            yield {"token": FALLBACK_RESPONSE}
+            yield {"sources": []}
+            return
+
+        records = self._prepare_source_records(documents)
+        context = await self._assemble_context(records)
+
+        logger.debug("Streaming answer with %d documents", len(documents))
+
+        parts = []
+        # O semáforo cobre o stream inteiro: a conexão fica ocupada até
+        # o último token, então ela conta na cota de concorrência.
+        async with _get_llm_semaphore():
+            async for chunk in self.llm.astream(
+                self._build_messages(question, context, language, chat_history)
+            ):
+                content = chunk.content
+                if content:
+                    parts.append(content)
+                    yield {"token": content}
+
+        answer_text = "".join(parts)
+        if not answer_text.strip():
+            logger.warning("LLM returned empty stream, using fallback")
+            yield {"token": FALLBACK_RESPONSE}
+            answer_text = FALLBACK_RESPONSE
+
+        if self._is_abstention(answer_text):
+            sources = []
+        else:
+            sources = self._extract_sources(records)
+
+        yield {"sources": sources}
+
     @staticmethod
     def _is_abstention(text: str) -> bool:
         """Detecta respostas de abstenção/reformulação (sem conteúdo factual)."""
@@ -138,7 +358,7 @@ class AnswerService:
         regra de uma fase à outra (ex.: consulta permitida online != presencial)."""
         t = (text or "").lower()
         has_presencial = "presencial" in t
-        has_online = bool(re.search(r"\bonline\b|fases?\s+on-?line", t))
+        has_online = bool(_ONLINE_RE.search(t))
         if has_presencial and has_online:
             return "menciona fase online E fase presencial — atenção ao trecho exato"
         if has_presencial:
@@ -147,54 +367,106 @@ class AnswerService:
             return "fases online"
         return "fase não especificada no trecho"
 
+    async def _assemble_context(self, records: List[Dict[str, Any]]) -> str:
+        """Monta o contexto, despachando para um thread quando grande.
+
+        No caso comum (poucos KB) a chamada direta evita o overhead do
+        executor; só volumes acima de _CONTEXT_TO_THREAD_CHARS pagam o
+        to_thread para não bloquear o event loop.
+        """
+        total_chars = sum(len(r["doc"].page_content) for r in records)
+        if total_chars > _CONTEXT_TO_THREAD_CHARS:
+            return await asyncio.to_thread(self._build_context_with_labels, records)
+        return self._build_context_with_labels(records)
+
+    @staticmethod
+    def _prepare_source_records(documents: List[Document]) -> List[Dict[str, Any]]:
+        """Limpa nome de fonte e página uma vez por documento.
+
+        Contexto e extração de fontes consumiam os mesmos metadados e
+        cada um refazia a limpeza de string por documento; preparar as
+        linhas uma vez corta esse trabalho pela metade por request.
+        """
+        records = []
+        for doc in documents:
+            metadata = doc.metadata or {}
+            source_name = metadata.get("source", "Regulamento")
+            records.append({
+                "doc": doc,
+                "metadata": metadata,
+                "source": source_name,
+                "source_clean": _PATH_PREFIX_RE.sub("", _strip_ext(source_name)).strip(),
+                "page": metadata.get("page"),
+            })
+        return records
+
     @staticmethod
-    def _build_context_with_labels(documents: List[Document]) -> str:
+    def _build_context_with_labels(records: List[Dict[str, Any]]) -> str:
         """
         Builds the textual context with source labels for citation.
         Each chunk is labeled with its source AND the phase it refers to.
+
+        Trechos idênticos (FAISS + BM25 podem devolver o mesmo chunk
+        por caminhos diferentes) entram uma vez só, cada trecho é
+        truncado em _MAX_SNIPPET_CHARS (fatia antes de qualquer
+        normalização — não aloca a string inteira) e o contexto total
+        respeita um orçamento amarrado ao max_retrieve, limitando os
+        tokens de entrada do LLM.
+
+        Montagem num StringIO único: o buffer cresce de forma
+        amortizada em vez de reter uma lista de strings intermediárias
+        por documento antes do join.
         """
-        context_parts = []
+        buf = io.StringIO()
+        seen = set()
+        budget = getattr(settings, "max_retrieve", 6) * _MAX_SNIPPET_CHARS
+        idx = 0
+
+        for record in records:
+            snippet = record["doc"].page_content[:_MAX_SNIPPET_CHARS]
+
+            # Dedup do chunk inteiro: prefixos iguais (cabeçalhos de
+            # página repetidos) não podem descartar corpos diferentes
+            fingerprint = hash(snippet)
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
 
-        for idx, doc in enumerate(documents, 1):
-            metadata = doc.metadata or {}
-            source_name = metadata.get("source", "Regulamento")
-            page = metadata.get("page", "?")
+            if len(snippet) > budget:
+                break
+            budget -= len(snippet)
 
-            source_clean = source_name.replace(".pdf", "").replace(".txt", "")
+            page = record["page"] if record["page"] is not None else "?"
 
-            phase = AnswerService._detect_phase(doc.page_content)
-            label = f"[Fonte {idx}: {source_clean}-pag{page} | aplica-se a: {phase}]"
-            context_parts.append(f"{label}\n{doc.page_content}")
+            phase = AnswerService._detect_phase(snippet)
+            idx += 1
+            if idx > 1:
+                buf.write("\n\n")
+            buf.write(_context_label(idx, record["source_clean"], page, phase))
+            buf.write(snippet)
 
-        return "\n\n".join(context_parts)
+        return buf.getvalue()
 
     @staticmethod
-    def _extract_sources(documents: List[Document]) -> List[Dict[str, Any]]:
+    def _extract_sources(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         sources = []
         seen_sources = set()
 
-        for doc in documents:
-            metadata = doc.metadata or {}
-
-            source_key = (
-                metadata.get("source", ""),
-                metadata.get("page"),
-            )
+        for record in records:
+            # Campos já deconstruídos na preparação: o dedup e a citação
+            # usam os valores prontos em vez de refazer metadata.get aqui.
+            page = record["page"]
+            source_key = (record["source"], page)
 
             if source_key in seen_sources:
                 continue
 
             seen_sources.add(source_key)
 
-            source_name = metadata.get("source", "Regulamento")
-            source_clean = source_name.replace(".pdf", "").replace(".txt", "")
-            source_clean = re.sub(r'^(?:data[/\\]raw[/\\]|data[/\\])', '', source_clean)
-            source_clean = source_clean.strip()
-
-            page = metadata.get("page")
+            source_clean = record["source_clean"]
+            metadata = record["metadata"]
 
-           
-            item_match = re.search(r"\b\d+(?:\.\d+){1,3}\b", doc.page_content)
+            item_match = _ITEM_RE.search(record["doc"].page_content)
             item = item_match.group(0) if item_match else None
 
             citation_parts = [source_clean]
@@ -224,23 +496,18 @@ class AnswerService:
         Ensures the answer has properly formatted citations with correct spacing.
         """
         
-        clean_answer = re.sub(r"^Resposta:\s*", "", answer_text, flags=re.IGNORECASE)
-
-      
-        citation_patterns = [
-            r"você pode encontrar.*$",
-            r"encontre mais em.*$",
-            r"consulte:.*$",
-            r"fonte:.*$",
-            r"fontes:.*$",
-            r"referência:.*$",
-        ]
-        
-        for pattern in citation_patterns:
-            # We use DOTALL or just ensure we catch the end of the string
-            clean_answer = re.sub(pattern, "", clean_answer, flags=re.IGNORECASE | re.MULTILINE | re.DOTALL)
-        
-       
+        clean_answer = answer_text
+        if clean_answer[:len(_RESPOSTA_PREFIX)].lower() == _RESPOSTA_PREFIX:
+            clean_answer = clean_answer[len(_RESPOSTA_PREFIX):]
+
+        lower = clean_answer.lower()
+        cut = min(
+            (pos for pos in (lower.find(m) for m in _TRAILER_MARKERS) if pos != -1),
+            default=-1,
+        )
+        if cut != -1:
+            clean_answer = clean_answer[:cut]
+
         clean_answer = clean_answer.strip()
 
         # As fontes vão SOMENTE no campo estruturado "sources" da resposta;
@@ -248,16 +515,13 @@ class AnswerService:
         return clean_answer
 
 
-# Module-level singleton instance for backward compatibility
-_service_instance: Optional[AnswerService] = None
-
-
+# Singleton via lru_cache: a construção é atômica sob o GIL, então
+# requests concorrentes não criam ChatOpenAI (e pools HTTP) duplicados
+# como o check-then-set com global permitia.
+@lru_cache(maxsize=1)
 def _get_service() -> AnswerService:
     """Get or create the singleton AnswerService instance."""
-    global _service_instance
-    if _service_instance is None:
-        _service_instance = AnswerService()
-    return _service_instance
+    return AnswerService()
 
 
 async def generate_answer(
@@ -1,9 +1,10 @@
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
+import asyncio
 import logging
 import re
 import os
 
-from tenacity import retry, stop_after_attempt, wait_exponential
 from src.utils.language import detect_language
 from src.rag_pipeline.reranker.reranker import rerank_documents
 from src.rag_pipeline.rewrite.rewrite_service import rewrite_query
@@ -11,9 +12,28 @@ from src.rag_pipeline.retrieval.vectorstore import get_retriever
 from src.rag_pipeline.generator.answer_service import AnswerService
 from src.app.core.config import settings
 from src.infra.cache import get_history, add_to_history
+from src.infra.semantic_cache import semantic_cache
 
 logger = logging.getLogger("bgo_chatbot.pipeline")
-answer_service = AnswerService()
+
+
+# Construído no primeiro uso (lru_cache é atômico sob o GIL): o client
+# OpenAI sai do caminho de import do módulo.
+@lru_cache(maxsize=1)
+def _get_answer_service() -> AnswerService:
+    return AnswerService()
+
+# Embeddings usados só pelo cache semântico (mesmo modelo do índice);
+# criados no primeiro uso para não pagar o client no import.
+_cache_embeddings = None
+
+
+def _get_cache_embeddings():
+    global _cache_embeddings
+    if _cache_embeddings is None:
+        from src.rag_pipeline.retrieval.embeddings import get_embeddings
+        _cache_embeddings = get_embeddings(model=settings.embedding_model)
+    return _cache_embeddings
 
 # Perguntas sobre o próprio assistente (meta) não devem passar pelo RAG:
 # o retrieval devolve trechos sobre como os ALUNOS embasam respostas,
@@ -29,6 +49,29 @@ _META_PATTERNS = re.compile(
     re.IGNORECASE,
 )
 
+# Pronomes/dêiticos que indicam dependência de contexto anterior
+# ("e quando ELA acontece?"): com eles a pergunta precisa do rewrite
+# mesmo sem sessão.
+_PRONOUN_PATTERN = re.compile(
+    r"\b(ele|ela|eles|elas|isso|isto|aquilo|dele|dela|it|this|that|they)\b",
+    re.IGNORECASE,
+)
+
+
+def _needs_rewrite(question: str, session_id: Optional[str]) -> bool:
+    """Decide se a pergunta precisa passar pelo LLM de rewrite.
+
+    Sem sessão não há histórico para resolver referências; se a pergunta
+    já é longa o bastante e não tem pronomes soltos, ela é autossuficiente
+    e o rewrite só adicionaria latência (e raramente muda o texto).
+    """
+    if session_id:
+        return True
+    if len(question.split()) < 4:
+        return True
+    return _PRONOUN_PATTERN.search(question) is not None
+
+
 _META_ANSWER_PT = (
     "Eu sou o GeoLUME, o assistente virtual da Olimpíada Brasileira de "
     "Geografia. Baseio minhas respostas exclusivamente nos documentos "
@@ -37,6 +80,25 @@ _META_ANSWER_PT = (
     "encontrei, em vez de inventar."
 )
 
+def _log_history_error(task: "asyncio.Task") -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("History save failed: %s", task.exception())
+
+
+def _save_history_background(session_id: str, question: str, answer: str) -> None:
+    """Grava o turno no histórico sem segurar a resposta.
+
+    O resultado da escrita não entra na resposta, então ela roda como
+    task de fundo (to_thread: add_to_history pode bloquear no Redis).
+    Falhas só geram warning — perder um turno de histórico é melhor que
+    falhar a resposta já gerada.
+    """
+    task = asyncio.create_task(
+        asyncio.to_thread(add_to_history, session_id, question, answer)
+    )
+    task.add_done_callback(_log_history_error)
+
+
 _META_ANSWER_EN = (
     "I am GeoLUME, the virtual assistant of the Brazilian Geography "
     "Olympiad. My answers are based exclusively on the official OBG "
@@ -45,9 +107,9 @@ _META_ANSWER_EN = (
     "not find it rather than guessing."
 )
 
-# 
-
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=4))
+# O retry fica nas chamadas remotas individuais (rewrite/geração, via
+# tenacity nos services): re-executar o pipeline inteiro numa falha de
+# geração replicaria rewrite + retrieval + rerank que já deram certo.
 async def process_query(
     question: str,
     language: str = None, # Fixed type hint default
@@ -81,30 +143,16 @@ async def process_query(
         meta_answer = _META_ANSWER_EN if language == "en" else _META_ANSWER_PT
         logger.info("Meta-question detected; answering directly without retrieval")
         if session_id:
-            add_to_history(session_id, question, meta_answer)
+            _save_history_background(session_id, question, meta_answer)
         return {"answer": meta_answer, "sources": []}
 
-    # --- 2. REWRITE ---
-    try:
-        rewritten = await rewrite_query(question, chat_history=chat_history)
-        logger.debug("Rewritten query: %s", rewritten)
-    except Exception as e:
-        logger.exception("Error during rewrite_query: %s", e)
-        # Se falhar o rewrite, usamos a pergunta original
-        rewritten = question
-
-    # --- 3. RETRIEVE ---
+    # --- 2. REWRITE + RETRIEVAL ESPECULATIVO ---
+    # O retrieval da pergunta ORIGINAL parte junto com o rewrite: no
+    # caso comum em que o rewrite não muda a pergunta, a latência do
+    # LLM de rewrite some do caminho crítico; se mudar, o especulativo
+    # é cancelado e o retrieval roda de novo com a pergunta reescrita.
     try:
-        k = getattr(settings, "max_retrieve", 6)
-        
-        # ✅ FIX: Usamos get_retriever que já trata o vectorstore global
-        retriever = get_retriever(k=k)
-        
-        # Invoke retriever asynchronously
-        docs = await retriever.ainvoke(rewritten)
-        
-        logger.info("Retrieved %d docs for query", len(docs))
-        
+        retriever = get_retriever(k=getattr(settings, "max_retrieve", 6))
     except RuntimeError as e:
         # Vectorstore não inicializado -> retornar mensagem amigável (não re-try)
         logger.error("Vectorstore not initialized: %s", e)
@@ -112,6 +160,51 @@ async def process_query(
             "answer": "O sistema de busca ainda não está pronto. Aguarde alguns segundos e tente novamente.",
             "sources": []
         }
+
+    speculative_task = asyncio.create_task(retriever.ainvoke(question))
+
+    if not _needs_rewrite(question, session_id):
+        # Fast-path: pergunta autossuficiente sem sessão — pula o LLM de
+        # rewrite e o retrieval especulativo vira o retrieval de verdade.
+        logger.debug("Skipping rewrite: stateless self-contained question")
+        rewritten = question
+    else:
+        try:
+            rewritten = await rewrite_query(question, chat_history=chat_history)
+            logger.debug("Rewritten query: %s", rewritten)
+        except Exception as e:
+            logger.exception("Error during rewrite_query: %s", e)
+            # Se falhar o rewrite, usamos a pergunta original
+            rewritten = question
+
+    # --- 2.5 CACHE SEMÂNTICO ---
+    # Pergunta reescrita semanticamente igual a uma já respondida ->
+    # devolve a resposta guardada sem retrieval nem geração. Sessões com
+    # histórico ficam de fora (a resposta depende do contexto da conversa).
+    query_embedding = None
+    if not session_id and semantic_cache.enabled:
+        try:
+            query_embedding = await _get_cache_embeddings().aembed_query(rewritten)
+            cached = semantic_cache.lookup(query_embedding)
+            if cached is not None:
+                logger.info("Semantic cache hit for query")
+                speculative_task.cancel()
+                return cached
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed: %s", e)
+            query_embedding = None
+
+    # --- 3. RETRIEVE ---
+    try:
+        if rewritten.strip().casefold() == question.strip().casefold():
+            # Rewrite não mudou a pergunta: o resultado especulativo vale
+            docs = await speculative_task
+        else:
+            speculative_task.cancel()
+            docs = await retriever.ainvoke(rewritten)
+
+        logger.info("Retrieved %d docs for query", len(docs))
+
     except Exception as e:
         logger.exception("Error during retrieval: %s", e)
         raise
@@ -125,22 +218,28 @@ async def process_query(
 
     # --- 4. RERANK (Opcional) ---
     if getattr(settings, "use_reranker", False): # Safer getattr
-        try:
-            rerank_k = getattr(settings, "max_rerank", 4)
-            docs = await rerank_documents(
-                query=rewritten,
-                documents=docs,
-                top_k=rerank_k,
-            )
-            logger.info("Reranked to %d docs", len(docs))
-        except Exception as e:
-            logger.warning("Reranker failed, using original docs: %s", e)
+        rerank_k = getattr(settings, "max_rerank", 4)
+        # Com <= rerank_k docs o cross-encoder não descartaria nada:
+        # seria um forward inteiro só para reordenar o que o RRF já
+        # ordenou. Só vale a pena quando há o que cortar.
+        if len(docs) <= rerank_k:
+            logger.debug("Skipping rerank: only %d docs retrieved", len(docs))
+        else:
+            try:
+                docs = await rerank_documents(
+                    query=rewritten,
+                    documents=docs,
+                    top_k=rerank_k,
+                )
+                logger.info("Reranked to %d docs", len(docs))
+            except Exception as e:
+                logger.warning("Reranker failed, using original docs: %s", e)
 
     # --- 5. GENERATE (LLM Final) ---
     # IMPORTANTE: usamos a pergunta REESCRITA (autossuficiente) na geração.
     # Antes, o gerador recebia a pergunta crua ("e na fase presencial?") sem
     # histórico e respondia "pergunta incompleta" mesmo com retrieval correto.
-    result = await answer_service.generate_answer(
+    result = await _get_answer_service().generate_answer(
         question=rewritten,
         documents=docs,
         language=language,
@@ -158,10 +257,99 @@ async def process_query(
 
     # Save to chat history if session_id provided
     if session_id:
-        add_to_history(session_id, question, answer)
-        logger.debug("Saved to chat history for session %s", session_id)
+        _save_history_background(session_id, question, answer)
+        logger.debug("Scheduled chat history save for session %s", session_id)
 
-    return {
+    response = {
         "answer": answer,
         "sources": sources
-    }
\ No newline at end of file
+    }
+
+    if query_embedding is not None:
+        semantic_cache.add(query_embedding, response)
+
+    return response
+
+
+async def process_query_stream(
+    question: str,
+    language: str = None,
+    session_id: Optional[str] = None
+):
+    """
+    Variante streaming de process_query para o endpoint SSE.
+
+    Gera eventos {"token": str} conforme o LLM produz a resposta e um
+    evento final {"sources": list}. As etapas de rewrite/retrieve são
+    idênticas ao process_query; só a geração muda (astream em vez de
+    ainvoke). Sem @retry: não dá para re-tentar tokens já enviados.
+    """
+    if not language or language == "auto":
+        language = detect_language(question)
+
+    logger.info("Streaming query (session=%s, language=%s): %s", session_id, language, question)
+
+    chat_history = ""
+    if session_id:
+        chat_history = get_history(session_id, max_turns=5)
+
+    # Meta-perguntas: resposta direta, num evento só
+    if _META_PATTERNS.search(question):
+        meta_answer = _META_ANSWER_EN if language == "en" else _META_ANSWER_PT
+        if session_id:
+            _save_history_background(session_id, question, meta_answer)
+        yield {"token": meta_answer}
+        yield {"sources": []}
+        return
+
+    if not _needs_rewrite(question, session_id):
+        logger.debug("Skipping rewrite: stateless self-contained question")
+        rewritten = question
+    else:
+        try:
+            rewritten = await rewrite_query(question, chat_history=chat_history)
+        except Exception as e:
+            logger.exception("Error during rewrite_query: %s", e)
+            rewritten = question
+
+    try:
+        retriever = get_retriever(k=getattr(settings, "max_retrieve", 6))
+        docs = await retriever.ainvoke(rewritten)
+    except RuntimeError as e:
+        logger.error("Vectorstore not initialized: %s", e)
+        yield {"token": "O sistema de busca ainda não está pronto. Aguarde alguns segundos e tente novamente."}
+        yield {"sources": []}
+        return
+
+    if not docs:
+        yield {"token": "Não encontrei nada no regulamento relacionado à sua pergunta. Pode reformular?"}
+        yield {"sources": []}
+        return
+
+    if getattr(settings, "use_reranker", False):
+        rerank_k = getattr(settings, "max_rerank", 4)
+        if len(docs) <= rerank_k:
+            logger.debug("Skipping rerank: only %d docs retrieved", len(docs))
+        else:
+            try:
+                docs = await rerank_documents(
+                    query=rewritten,
+                    documents=docs,
+                    top_k=rerank_k,
+                )
+            except Exception as e:
+                logger.warning("Reranker failed, using original docs: %s", e)
+
+    answer_parts = []
+    async for event in _get_answer_service().stream_answer(
+        question=rewritten,
+        documents=docs,
+        language=language,
+        chat_history=chat_history,
+    ):
+        if "token" in event:
+            answer_parts.append(event["token"])
+        yield event
+
+    if session_id:
+        _save_history_background(session_id, question, "".join(answer_parts))
\ No newline at end of file
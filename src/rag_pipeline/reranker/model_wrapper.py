@@ -1,7 +1,17 @@
-from typing import List
+import hashlib
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
 from langchain_core.documents import Document #new version of langchain
 from sentence_transformers import CrossEncoder
 
+logger = logging.getLogger("bgo_chatbot.reranker")
+
+# Limite do cache de scores (par query+doc -> score do cross-encoder)
+_SCORE_CACHE_MAX_ENTRIES = 2048
+
 
 class CrossEncoderReranker:
     """
@@ -15,6 +25,28 @@ class CrossEncoderReranker:
         device: str = "cpu",
     ):
         self.model = CrossEncoder(model_name, device=device)
+        # fp16 em GPU / int8 dinâmico em CPU: metade (ou 1/4) da banda
+        # de memória no forward, sem diferença prática de ordenação.
+        try:
+            if device.startswith("cuda"):
+                self.model.model.half()
+            else:
+                self.model.model = torch.quantization.quantize_dynamic(
+                    self.model.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+        except Exception as e:
+            logger.warning("Reranker quantization unavailable, using fp32: %s", e)
+        # Scores já computados por par (query, doc): os textos dos
+        # chunks são estáveis entre queries, então pares repetidos
+        # pulam tokenização e forward de uma vez.
+        self._score_cache: Dict[Tuple[str, str], float] = {}
+
+    @staticmethod
+    def _text_key(text: str) -> str:
+        # Texto inteiro na chave: chunks de PDF repetem cabeçalhos, e um
+        # hash só do prefixo faria pares distintos reusarem scores. O
+        # blake2b completo é desprezível perto de um forward do modelo.
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
 
     def rerank(
         self,
@@ -26,13 +58,85 @@ class CrossEncoderReranker:
         if not documents:
             return []
 
-        pairs = [(query, doc.page_content) for doc in documents]
-        scores = self.model.predict(pairs)
+        query_key = self._text_key(query)
+        pair_keys = [(query_key, self._text_key(doc.page_content)) for doc in documents]
+
+        scores = np.empty(len(documents), dtype=np.float32)
+        miss_indices = []
+        for i, key in enumerate(pair_keys):
+            cached = self._score_cache.get(key)
+            if cached is None:
+                miss_indices.append(i)
+            else:
+                scores[i] = cached
+
+        if miss_indices:
+            pairs = [(query, documents[i].page_content) for i in miss_indices]
+            # inference_mode desliga autograd/versionamento de tensores;
+            # batch_size fixo evita o default conservador do predict.
+            with torch.inference_mode():
+                fresh = self.model.predict(
+                    pairs,
+                    batch_size=32,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                )
+            for i, score in zip(miss_indices, fresh):
+                scores[i] = score
+                if len(self._score_cache) >= _SCORE_CACHE_MAX_ENTRIES:
+                    self._score_cache.pop(next(iter(self._score_cache)))
+                self._score_cache[pair_keys[i]] = float(score)
+
+        return self._select(documents, scores, top_k)
+
+    @staticmethod
+    def _select(
+        documents: List[Document],
+        scores: "np.ndarray",
+        top_k: int,
+    ) -> List[Document]:
+        # Seleção top-k em O(N) com argpartition + sort só na fatia —
+        # dispensa a lista de tuplas (score, doc) e o comparador Python.
+        k = min(top_k, len(documents))
+        top_idx = np.argpartition(-scores, k - 1)[:k]
+        top_idx = top_idx[np.argsort(-scores[top_idx])]
+
+        for i in top_idx:
+            documents[i].metadata["rerank_score"] = float(scores[i])
+        return [documents[i] for i in top_idx]
+
+    def rerank_many(
+        self,
+        requests: List[Tuple[str, List[Document], int]],
+    ) -> List[List[Document]]:
+        """Reordena vários pedidos (query, docs, top_k) num forward só.
+
+        Todos os pares viram um único predict — o modelo enche o batch
+        em vez de rodar K forwards pequenos sob concorrência. A seleção
+        top-k continua por pedido.
+        """
+        flat_pairs = []
+        for query, documents, _top_k in requests:
+            flat_pairs.extend((query, doc.page_content) for doc in documents)
 
-        scored_docs = []
-        for doc, score in zip(documents, scores):
-            doc.metadata["rerank_score"] = float(score)
-            scored_docs.append((score, doc))
+        if flat_pairs:
+            with torch.inference_mode():
+                all_scores = self.model.predict(
+                    flat_pairs,
+                    batch_size=32,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                )
 
-        scored_docs.sort(key=lambda x: x[0], reverse=True)
-        return [doc for _, doc in scored_docs[:top_k]]
+        results: List[List[Document]] = []
+        pos = 0
+        for query, documents, top_k in requests:
+            if not documents:
+                results.append([])
+                continue
+            scores = np.asarray(
+                all_scores[pos:pos + len(documents)], dtype=np.float32
+            )
+            pos += len(documents)
+            results.append(self._select(documents, scores, top_k))
+        return results
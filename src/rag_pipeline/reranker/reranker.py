@@ -1,18 +1,124 @@
 import asyncio
-from typing import List
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from langchain_core.documents import Document
 from .model_wrapper import CrossEncoderReranker
 
-_reranker = None
+# Micro-batching opcional (mesmo padrão do REWRITE_BATCHING): pedidos de
+# rerank concorrentes esperam uma janela curta e são pontuados num
+# forward só — o cross-encoder enche o batch em vez de rodar vários
+# forwards pequenos. Só vale a pena sob carga concorrente real.
+RERANK_BATCHING = os.getenv("RERANK_BATCHING", "false").strip().lower() in (
+    "1", "true", "yes"
+)
+_BATCH_MAX_PAIRS = 32
+_BATCH_WINDOW_S = 0.02  # janela de coalescência (20ms)
 
 
-def get_reranker() -> CrossEncoderReranker:
+def _limit_torch_threads():
+    """Evita que cada worker espalhe threads BLAS próprios."""
+    import torch
+    torch.set_num_threads(1)
+
+
+# Pool dedicado do reranker: no executor default do to_thread as
+# chamadas do cross-encoder disputariam fila com todo I/O bloqueante da
+# app (head-of-line blocking sob carga). 2 workers = concorrência útil
+# do modelo em CPU.
+_rerank_executor = ThreadPoolExecutor(
+    max_workers=2,
+    thread_name_prefix="rerank",
+    initializer=_limit_torch_threads,
+)
+
+# Singleton preguiçoso com double-check sob lock: sem ele, as primeiras
+# requests concorrentes carregariam o CrossEncoder (~100MB) em duplicata.
+_reranker: Optional[CrossEncoderReranker] = None
+_reranker_lock = asyncio.Lock()
+
+
+async def get_reranker() -> CrossEncoderReranker:
     global _reranker
     if _reranker is None:
-        _reranker = CrossEncoderReranker()
+        async with _reranker_lock:
+            if _reranker is None:
+                # Load do modelo é bloqueante — roda fora do event loop
+                _reranker = await asyncio.to_thread(CrossEncoderReranker)
     return _reranker
 
 
+class _RerankBatcher:
+    """Coalesce pedidos de rerank concorrentes num predict único.
+
+    Um worker preguiçoso drena a fila: espera a janela de ~20ms (ou até
+    acumular _BATCH_MAX_PAIRS pares query/doc), manda tudo num
+    rerank_many e distribui os resultados pelos futures. Pedido sozinho
+    segue o caminho normal — a janela só paga quando há companhia.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: "asyncio.Task | None" = None
+
+    async def rerank(
+        self, query: str, documents: List[Document], top_k: int
+    ) -> List[Document]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put_nowait((query, documents, top_k, future))
+        # Worker nasce na primeira chamada e morre quando fica ocioso —
+        # dispensa hook de startup no app.
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._drain())
+        return await future
+
+    async def _drain(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                return
+
+            batch = [item]
+            total_pairs = len(item[1])
+            deadline = loop.time() + _BATCH_WINDOW_S
+            while total_pairs < _BATCH_MAX_PAIRS:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(nxt)
+                total_pairs += len(nxt[1])
+
+            await self._process(batch)
+
+    async def _process(self, batch: list) -> None:
+        reranker = await get_reranker()
+        loop = asyncio.get_running_loop()
+        requests = [(query, docs, top_k) for query, docs, top_k, _ in batch]
+        try:
+            results = await loop.run_in_executor(
+                _rerank_executor, reranker.rerank_many, requests
+            )
+        except Exception as exc:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (*_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+_batcher = _RerankBatcher()
+
+
 async def rerank_documents(
     query: str,
     documents: List[Document],
@@ -22,6 +128,13 @@ async def rerank_documents(
     Reranks documents using cross-encoder model.
     Wraps synchronous rerank call in async executor to avoid blocking event loop.
     """
-    reranker = get_reranker()
-    # Run blocking synchronous call in thread pool to avoid blocking event loop
-    return await asyncio.to_thread(reranker.rerank, query, documents, top_k)
+    if RERANK_BATCHING:
+        return await _batcher.rerank(query, documents, top_k)
+
+    reranker = await get_reranker()
+    # Run blocking synchronous call in the dedicated pool to avoid
+    # blocking the event loop (and the default executor's queue)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _rerank_executor, reranker.rerank, query, documents, top_k
+    )
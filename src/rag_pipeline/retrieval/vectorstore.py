@@ -2,9 +2,10 @@ import logging
 import re
 import unicodedata
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
@@ -22,6 +23,12 @@ _vectorstore = None
 _bm25 = None
 _bm25_docs: List[Document] = []
 
+# Retrievers por k: o _DiverseRetriever é imutável depois de criado e o
+# pipeline pede o mesmo k em toda request — reaproveitar a instância
+# poupa uma alocação por query no hot path. Invalidado quando o índice
+# é (re)carregado.
+_retriever_cache: Dict[int, "_DiverseRetriever"] = {}
+
 
 def _tokenize_pt(text: str) -> List[str]:
     """Tokenização simples para BM25: minúsculas, sem acentos, alfanumérico."""
@@ -56,7 +63,15 @@ def _is_support_doc(doc: Document) -> bool:
     return any(w in src for w in ("senha", "acesso", "duvida", "procedimento", "suporte"))
 
 
-def init_vectorstore(index_path: str):
+def init_vectorstore(index_path: str, mmap: bool = True):
+    """Carrega o índice FAISS salvo e (se possível) constrói o BM25.
+
+    Com mmap=True (default) o arquivo index.faiss é mapeado em memória
+    (IO_FLAG_MMAP) em vez de copiado para a RAM: o page cache do SO
+    traz só as páginas tocadas pela busca, então o cold-start lê pouco
+    mais que os metadados do índice. Se o read_index mapeado falhar
+    (formato/filesystem sem suporte), cai no load_local tradicional.
+    """
     global _vectorstore
 
     index_dir = Path(index_path)
@@ -70,14 +85,39 @@ def init_vectorstore(index_path: str):
     # Cria embeddings (TEM que ser o mesmo modelo usado no build_index)
     embeddings = OpenAIEmbeddings(model=settings.embedding_model)
 
-    # Carrega FAISS
-    _vectorstore = FAISS.load_local(
-        str(index_dir),
-        embeddings,
-        allow_dangerous_deserialization=True  # necessário para FAISS
-    )
+    if mmap:
+        import pickle
+
+        import faiss
+
+        try:
+            index = faiss.read_index(
+                str(index_dir / "index.faiss"),
+                faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+            )
+            with open(index_dir / "index.pkl", "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            _vectorstore = FAISS(
+                embedding_function=embeddings,
+                index=index,
+                docstore=docstore,
+                index_to_docstore_id=index_to_docstore_id,
+            )
+        except Exception as e:
+            logger.warning("Mmap load failed (%s); falling back to load_local", e)
+            mmap = False
+
+    if not mmap:
+        # Carrega FAISS
+        _vectorstore = FAISS.load_local(
+            str(index_dir),
+            embeddings,
+            allow_dangerous_deserialization=True  # necessário para FAISS
+        )
 
     _build_bm25()
+    # Retrievers antigos apontam para o vectorstore anterior
+    _retriever_cache.clear()
 
     return _vectorstore
 
@@ -111,9 +151,34 @@ def create_vectorstore(
         raise ValueError("Embeddings instance is required")
     
     print(f"[VECTORSTORE] Creating FAISS index from {len(documents)} documents")
-    vectorstore = FAISS.from_documents(documents, embeddings)
+    # Vetores L2-normalizados + métrica de produto interno = cosseno de
+    # verdade (a métrica certa para estes embeddings), sem o sqrt da
+    # distância L2 por comparação. normalize_L2 também normaliza o
+    # embedding da query no search, mantendo os dois lados coerentes.
+    vectorstore = FAISS.from_documents(
+        documents,
+        embeddings,
+        normalize_L2=True,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
+    # Troca o índice flat default (busca exaustiva O(N·d)) por HNSW,
+    # grafo com busca sub-linear. Para corpora < 100k vetores o HNSW é
+    # preferível ao IVFPQ: não precisa de treino e a memória extra é
+    # pequena. Os vetores são re-adicionados na mesma ordem, então o
+    # mapeamento index_to_docstore_id continua válido.
+    import faiss
+
+    flat_index = vectorstore.index
+    if flat_index.ntotal > 0:
+        hnsw_index = faiss.IndexHNSWFlat(flat_index.d, 32, faiss.METRIC_INNER_PRODUCT)
+        hnsw_index.hnsw.efSearch = 64
+        hnsw_index.add(flat_index.reconstruct_n(0, flat_index.ntotal))
+        vectorstore.index = hnsw_index
+        print(f"[VECTORSTORE] Rebuilt index as HNSW ({flat_index.ntotal} vectors)")
+
     print("[VECTORSTORE] FAISS index created successfully")
-    
+
     return vectorstore
 
 
@@ -229,6 +294,44 @@ class _DiverseRetriever:
         return self.invoke(query)
 
 
+def batch_retrieve(queries: List[str], k: int = settings.max_retrieve) -> List[List[Document]]:
+    """Busca semântica para várias queries numa tacada só.
+
+    Embeda todas as queries numa única chamada (embed_documents) e faz
+    um search vetorizado direto no índice FAISS — N round-trips de
+    embedding viram 1. Pensado para o caminho de sub-perguntas
+    decompostas do rewrite; não aplica a fusão BM25/RRF do
+    _DiverseRetriever, só a busca semântica pura.
+
+    Retorna uma lista de listas de Document, na ordem das queries.
+    """
+    if _vectorstore is None:
+        raise RuntimeError(
+            "Vectorstore não inicializado. "
+            "Chame init_vectorstore() na inicialização do servidor."
+        )
+    if not queries:
+        return []
+
+    import numpy as np
+
+    embeddings = getattr(_vectorstore, "embeddings", None) or _vectorstore.embedding_function
+    vecs = embeddings.embed_documents(queries)
+    _scores, indices = _vectorstore.index.search(np.asarray(vecs, dtype="float32"), k)
+
+    results: List[List[Document]] = []
+    for row in indices:
+        docs = []
+        for i in row:
+            if i == -1:  # FAISS preenche com -1 quando há menos de k vizinhos
+                continue
+            docs.append(
+                _vectorstore.docstore.search(_vectorstore.index_to_docstore_id[int(i)])
+            )
+        results.append(docs)
+    return results
+
+
 def get_retriever(k: int = settings.max_retrieve):
     """
     Retorna um retriever configurado com k documentos.
@@ -238,4 +341,7 @@ def get_retriever(k: int = settings.max_retrieve):
             "Vectorstore não inicializado. "
             "Chame init_vectorstore() na inicialização do servidor."
         )
-    return _DiverseRetriever(_vectorstore, k=k)
\ No newline at end of file
+    retriever = _retriever_cache.get(k)
+    if retriever is None:
+        retriever = _retriever_cache[k] = _DiverseRetriever(_vectorstore, k=k)
+    return retriever
\ No newline at end of file
@@ -17,6 +17,9 @@ Key features:
 - Bilingual support (PT-BR/EN) with automatic detection
 """
 
+import re
+import sys
+from functools import lru_cache
 from typing import Literal
 
 # ==============================================================================
@@ -26,46 +29,120 @@ MAX_DECOMPOSED_QUERIES = 3
 REWRITE_TEMPERATURE = 0
 MAX_REWRITE_TOKENS = 300
 
+# Linha não-vazia com numeração opcional (1., 2), etc.) — um finditer
+# em MULTILINE varre a resposta inteira em C, sem split/strip por linha.
+_QUERY_LINE_PATTERN = re.compile(
+    r"^[ \t]*(?:\d+[\.\)][ \t]*)?(.*?)[ \t\r]*$", re.MULTILINE
+)
+
 
 # ==============================================================================
 # DETECÇÃO DE IDIOMA
 # ==============================================================================
 
+# Palavras-chave comuns em português
+_PT_KEYWORDS = (
+    "que", "qual", "como", "quando", "onde", "por", "para",
+    "regulamento", "prova", "olimpíada", "posso", "pode",
+    "devo", "preciso", "está", "são", "foi", "será", "isso",
+    "aquilo", "ele", "ela"
+)
+
+# Palavras-chave comuns em inglês
+_EN_KEYWORDS = (
+    "what", "which", "how", "when", "where", "why", "can",
+    "regulation", "exam", "olympiad", "should", "must",
+    "is", "are", "was", "will", "the", "this", "that", "it"
+)
+
+# Alternation única com grupos nomeados (maiores primeiro, p/ "quando"
+# não perder para "que"): uma passada só pelo texto classifica cada hit
+# via lastgroup, em vez de dois findall que varrem o texto duas vezes.
+_LANG_PATTERN = re.compile(
+    r"\b(?:(?P<pt>%s)|(?P<en>%s))\b" % (
+        "|".join(sorted(_PT_KEYWORDS, key=len, reverse=True)),
+        "|".join(sorted(_EN_KEYWORDS, key=len, reverse=True)),
+    )
+)
+
+# pyahocorasick (opcional): um único passe pelo texto encontra todas as
+# keywords de uma vez, em vez de o regex tentar a alternation inteira a
+# cada posição. Sem o pacote, seguimos com os patterns compilados.
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def _build_automaton(words):
+    automaton = ahocorasick.Automaton()
+    for word in words:
+        automaton.add_word(word, len(word))
+    automaton.make_automaton()
+    return automaton
+
+
+_PT_AUTOMATON = _build_automaton(_PT_KEYWORDS) if ahocorasick else None
+_EN_AUTOMATON = _build_automaton(_EN_KEYWORDS) if ahocorasick else None
+
+
+def _count_word_hits(automaton, text: str) -> int:
+    """Conta matches do automaton que caem em fronteira de palavra
+    (mesma semântica do \\b dos patterns compilados)."""
+    count = 0
+    last = len(text) - 1
+    for end, length in automaton.iter(text):
+        start = end - length + 1
+        if start and text[start - 1].isalnum():
+            continue
+        if end != last and text[end + 1].isalnum():
+            continue
+        count += 1
+    return count
+
+# Perguntas curtas se repetem muito entre rewrite/decomposição/fallback;
+# acima deste tamanho não vale guardar a chave no cache.
+_MEMO_MAX_LEN = 256
+
+
+@lru_cache(maxsize=1024)
+def _scan_language(text_lower: str) -> Literal["pt", "en"]:
+    if _PT_AUTOMATON is not None:
+        pt_count = _count_word_hits(_PT_AUTOMATON, text_lower)
+        en_count = _count_word_hits(_EN_AUTOMATON, text_lower)
+    else:
+        pt_count = 0
+        en_count = 0
+        for match in _LANG_PATTERN.finditer(text_lower):
+            if match.lastgroup == "pt":
+                pt_count += 1
+            else:
+                en_count += 1
+
+    # Se empate ou nenhuma detecção, assume português (idioma padrão)
+    return "pt" if pt_count >= en_count else "en"
+
+
 def detect_language(text: str) -> Literal["pt", "en"]:
     """
 
     Args:
         text: Texto para detecção de idioma
-        
+
     Returns:
         "pt" para português ou "en" para inglês
-        
+
     Note:
         Usa heurística baseada em palavras comuns. Para casos ambíguos,
-        assume português (idioma padrão do sistema).
+        assume português (idioma padrão do sistema). Resultados para
+        textos curtos são memoizados (o scan de keywords domina o custo).
     """
-    text_lower = text.lower()
-    
-    # Palavras-chave comuns em português
-    pt_keywords = [
-        "que", "qual", "como", "quando", "onde", "por", "para",
-        "regulamento", "prova", "olimpíada", "posso", "pode",
-        "devo", "preciso", "está", "são", "foi", "será", "isso",
-        "aquilo", "ele", "ela"
-    ]
-    
-    # Palavras-chave comuns em inglês
-    en_keywords = [
-        "what", "which", "how", "when", "where", "why", "can",
-        "regulation", "exam", "olympiad", "should", "must",
-        "is", "are", "was", "will", "the", "this", "that", "it"
-    ]
-    
-    pt_count = sum(1 for kw in pt_keywords if kw in text_lower)
-    en_count = sum(1 for kw in en_keywords if kw in text_lower)
-    
-    # Se empate ou nenhuma detecção, assume português (idioma padrão)
-    return "pt" if pt_count >= en_count else "en"
+    # .lower() copia a string inteira mesmo quando nada muda; queries já
+    # minúsculas (comuns) pulam a cópia.
+    text_lower = text if text.islower() else text.lower()
+    if len(text_lower) <= _MEMO_MAX_LEN:
+        return _scan_language(text_lower)
+    return _scan_language.__wrapped__(text_lower)
 
 
 # ==============================================================================
@@ -189,39 +266,104 @@ Sub-questions (one per line, numbered 1., 2., 3.):"""
 # FUNÇÕES DE FORMATAÇÃO DE PROMPTS
 # ==============================================================================
 
+# Seleção de template como lookup em dict congelado no import — as
+# funções abaixo não re-avaliam cadeias de if/else por chamada.
+_REWRITE_TEMPLATES = {
+    ("pt", False): QUERY_REWRITE_TEMPLATE_PT,
+    ("en", False): QUERY_REWRITE_TEMPLATE_EN,
+    ("pt", True): QUERY_REWRITE_MINIMAL_TEMPLATE_PT,
+    ("en", True): QUERY_REWRITE_MINIMAL_TEMPLATE_EN,
+}
+
+_DECOMPOSITION_TEMPLATES = {
+    "pt": DECOMPOSITION_TEMPLATE_PT,
+    "en": DECOMPOSITION_TEMPLATE_EN,
+}
+
+# max_queries aparece no MEIO do bloco de instruções: interpolar por
+# chamada mudaria o prefixo e derrubaria o prompt cache do provedor.
+# Como o valor vem de um conjunto pequeno, pré-formata um template por
+# (idioma, n) no import — só {query} fica variável, no fim do prompt.
+_DECOMPOSITION_PREBOUND = {
+    (lang, n): template.replace("{max_queries}", str(n))
+    for lang, template in _DECOMPOSITION_TEMPLATES.items()
+    for n in (2, 3, 4, 5, 6)
+}
+
+
+def _split_template(template: str, placeholder: str) -> tuple:
+    """Separa o bloco estático de instruções do sufixo dinâmico."""
+    prefix, _, suffix = template.partition(placeholder)
+    return prefix.rstrip("\n"), suffix
+
+
+# Prefixo estático (instruções) separado do sufixo dinâmico por template.
+# Mandar as instruções como mensagem de sistema idêntica em toda chamada
+# permite ao provedor reaproveitar o KV-cache do prefixo entre requests.
+_REWRITE_MESSAGE_PARTS = {
+    ("pt", False): _split_template(QUERY_REWRITE_TEMPLATE_PT, "{chat_history}"),
+    ("en", False): _split_template(QUERY_REWRITE_TEMPLATE_EN, "{chat_history}"),
+    ("pt", True): _split_template(QUERY_REWRITE_MINIMAL_TEMPLATE_PT, "{question}"),
+    ("en", True): _split_template(QUERY_REWRITE_MINIMAL_TEMPLATE_EN, "{question}"),
+}
+
+
+@lru_cache(maxsize=256)
+def get_query_rewrite_messages(
+    question: str,
+    chat_history: str = "",
+    language: str = "pt",
+    use_minimal: "bool | None" = None
+) -> tuple:
+    """
+    Variante de get_query_rewrite_prompt que retorna (system, user).
+
+    O bloco de instruções (estático por idioma/variante) vai na mensagem
+    de sistema e só o conteúdo que muda por chamada (histórico/pergunta)
+    vai na mensagem de usuário — o prefixo estável maximiza hits no
+    prompt cache do provedor.
+    """
+    # Caller que já decidiu passa o flag e pula o re-scan do histórico
+    if use_minimal is None:
+        use_minimal = not chat_history or not chat_history.strip()
+    minimal = bool(use_minimal)
+    system, suffix = _REWRITE_MESSAGE_PARTS[
+        ("pt" if language == "pt" else "en", minimal)
+    ]
+    if minimal:
+        return system, question + suffix
+    return system, chat_history + suffix.format(question=question)
+
+
 def get_query_rewrite_prompt(
     question: str,
     chat_history: str = "",
     language: str = "pt",
-    use_minimal: bool = False
+    use_minimal: "bool | None" = None
 ) -> str:
     """
     Formata o prompt de reescrita de query (decontextualização).
-    
+
     Args:
         question: Pergunta original do usuário
         chat_history: Histórico de conversa formatado como string
         language: Idioma ("pt" ou "en")
-        use_minimal: Se True, usa template minimal (sem histórico)
-        
+        use_minimal: Se True, usa template minimal (sem histórico);
+            None (padrão) decide pelo próprio histórico
+
     Returns:
         Prompt formatado pronto para envio ao LLM
 
     """
-    # Se não há histórico ou use_minimal=True, usa template minimal
-    if use_minimal or not chat_history or chat_history.strip() == "":
-        template = (
-            QUERY_REWRITE_MINIMAL_TEMPLATE_PT if language == "pt"
-            else QUERY_REWRITE_MINIMAL_TEMPLATE_EN
-        )
+    # None = decide aqui; caller que já sabe passa o flag e evita o scan
+    if use_minimal is None:
+        use_minimal = not chat_history or not chat_history.strip()
+    minimal = bool(use_minimal)
+    template = _REWRITE_TEMPLATES[("pt" if language == "pt" else "en", minimal)]
+
+    if minimal:
         return template.format(question=question)
-    
-    # Usa template completo com histórico
-    template = (
-        QUERY_REWRITE_TEMPLATE_PT if language == "pt"
-        else QUERY_REWRITE_TEMPLATE_EN
-    )
-    
+
     return template.format(
         question=question,
         chat_history=chat_history
@@ -244,21 +386,40 @@ def get_decomposition_prompt(
     Returns:
         Prompt formatado pronto para envio ao LLM
     """
-    template = (
-        DECOMPOSITION_TEMPLATE_PT if language == "pt"
-        else DECOMPOSITION_TEMPLATE_EN
-    )
-    
-    return template.format(
-        query=query,
-        max_queries=max_queries
-    )
+    lang = "pt" if language == "pt" else "en"
+    template = _DECOMPOSITION_PREBOUND.get((lang, max_queries))
+    if template is None:
+        # Valor fora do conjunto usual: formata na hora (prefixo instável
+        # só para este caso raro).
+        template = _DECOMPOSITION_TEMPLATES[lang].replace(
+            "{max_queries}", str(max_queries)
+        )
+
+    return template.format(query=query)
 
 
 # ==============================================================================
 # UTILITÁRIOS
 # ==============================================================================
 
+# Labels capitalizados pré-internados — evita um str novo por turno
+_ROLE_LABELS = {
+    "user": sys.intern("User"),
+    "assistant": sys.intern("Assistant"),
+    "system": sys.intern("System"),
+}
+
+# Memo do histórico formatado: dentro de um turno a MESMA conversa é
+# formatada mais de uma vez (retries, sub-perguntas em paralelo). A
+# chave é o CONTEÚDO — tupla de pares (role, content) — e não id():
+# o CPython reusa ids de listas liberadas, então uma chave por
+# identidade devolveria o texto de uma conversa antiga para uma lista
+# nova. Montar a tupla é uma passada barata sem formatação; FIFO
+# pequeno porque o memo só precisa sobreviver ao turno corrente.
+_FMT_CACHE: dict = {}
+_FMT_CACHE_MAX_ENTRIES = 64
+
+
 def format_chat_history(history: list[dict]) -> str:
     """
     Formata histórico de conversa para inclusão no prompt.
@@ -280,14 +441,28 @@ def format_chat_history(history: list[dict]) -> str:
     """
     if not history:
         return ""
-    
-    formatted_lines = []
-    for turn in history:
-        role = turn.get("role", "user").capitalize()
-        content = turn.get("content", "")
-        formatted_lines.append(f"{role}: {content}")
-    
-    return "\n".join(formatted_lines)
+
+    key = tuple(
+        (turn.get("role", "user"), turn.get("content", "")) for turn in history
+    )
+    cached = _FMT_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    # str.join direto sobre um generator: sem lista intermediária nem
+    # appends por turno. Labels de role vêm do dict pré-capitalizado —
+    # .capitalize() só roda para roles fora do vocabulário usual.
+    role_labels = _ROLE_LABELS
+    formatted = "\n".join(
+        f"{role_labels.get(turn.get('role', 'user')) or turn.get('role', 'user').capitalize()}"
+        f": {turn.get('content', '')}"
+        for turn in history
+    )
+
+    if len(_FMT_CACHE) >= _FMT_CACHE_MAX_ENTRIES:
+        _FMT_CACHE.pop(next(iter(_FMT_CACHE)))
+    _FMT_CACHE[key] = formatted
+    return formatted
 
 
 def parse_decomposed_queries(llm_response: str) -> list[str]:
@@ -305,37 +480,34 @@ def parse_decomposed_queries(llm_response: str) -> list[str]:
         >>> parse_decomposed_queries(response)
         ['Quais são os critérios?', 'Como é a prova?']
     """
-    lines = llm_response.strip().split("\n")
     queries = []
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # Remove numeração (1., 2., 1), 2), etc.)
-        import re
-        cleaned = re.sub(r"^\d+[\.\)]\s*", "", line)
-        
+
+    # Uma passada C sobre a resposta inteira: o grupo 1 já vem sem
+    # numeração nem espaços das pontas.
+    for match in _QUERY_LINE_PATTERN.finditer(llm_response):
+        cleaned = match.group(1)
+
         if cleaned:
             queries.append(cleaned)
-    
-    return queries[:MAX_DECOMPOSED_QUERIES]  # Garante limite máximo
+            # Para no limite — não limpa linhas que seriam descartadas
+            if len(queries) == MAX_DECOMPOSED_QUERIES:
+                break
+
+    return queries
+
+
+# Histórico com menos que isso provavelmente é inútil para o rewrite
+_MIN_USEFUL_HISTORY_LEN = 50
 
 
 def should_use_minimal_prompt(chat_history: str) -> bool:
     """
     Determina se deve usar prompt minimal (economia de tokens).
 
+    Decisão por comprimento puro — um len() após um único strip cobre
+    tanto o caso vazio quanto o de histórico curto demais.
     """
-    if not chat_history or chat_history.strip() == "":
-        return True
-    
-    # Se histórico tem menos de 50 caracteres, provavelmente é inútil
-    if len(chat_history.strip()) < 50:
-        return True
-    
-    return False
+    return not chat_history or len(chat_history.strip()) < _MIN_USEFUL_HISTORY_LEN
 
 
 # ==============================================================================
@@ -358,20 +530,32 @@ FALLBACK_MESSAGES = {
 }
 
 
+# Dict achatado (idioma, tipo) -> mensagem: um hash lookup no lugar dos
+# dois .get() encadeados — e dispensa o lru_cache que só embrulhava isso.
+_FALLBACK_FLAT = {
+    (lang, message_type): message
+    for lang, messages in FALLBACK_MESSAGES.items()
+    for message_type, message in messages.items()
+}
+_FALLBACK_DEFAULT = FALLBACK_MESSAGES["pt"]["invalid_query"]
+
+
 def get_fallback_message(message_type: str, language: str = "pt") -> str:
     """
     Retorna mensagem de fallback apropriada.
-    
+
     Args:
         message_type: Tipo da mensagem ("empty_query", "invalid_query", etc.)
         language: Idioma ("pt" ou "en")
-        
+
     Returns:
         Mensagem de fallback formatada
     """
-    return FALLBACK_MESSAGES.get(language, FALLBACK_MESSAGES["pt"]).get(
-        message_type,
-        FALLBACK_MESSAGES["pt"]["invalid_query"]
+    # Idioma desconhecido ainda cai no texto pt do MESMO tipo (como o
+    # duplo .get fazia); o default só cobre tipo inexistente.
+    return (
+        _FALLBACK_FLAT.get((language, message_type))
+        or _FALLBACK_FLAT.get(("pt", message_type), _FALLBACK_DEFAULT)
     )
 
 
@@ -379,18 +563,20 @@ def get_fallback_message(message_type: str, language: str = "pt") -> str:
 # VALIDAÇÃO DE QUERIES (Opcional)
 # ==============================================================================
 
+# Um caractere que NÃO seja pontuação/espaço basta para a query valer:
+# o search para no primeiro hit, sem a cópia da string que o translate
+# faria nem loop Python por char.
+_NON_PUNCTUATION_RE = re.compile(r"[^\s?!.,;:]")
+
+
 def is_valid_query(query: str, min_length: int = 3) -> bool:
     if not query or not isinstance(query, str):
         return False
-    
+
     query_clean = query.strip()
-    
-    # Muito curta
-    if len(query_clean) < min_length:
-        return False
-    
-    # Apenas pontuação
-    if all(c in "?!.,;: " for c in query_clean):
-        return False
-    
-    return True
\ No newline at end of file
+
+    # Curta demais, ou só pontuação/espaços
+    return (
+        len(query_clean) >= min_length
+        and _NON_PUNCTUATION_RE.search(query_clean) is not None
+    )
\ No newline at end of file
@@ -4,44 +4,507 @@ Rewrite service: transforma a pergunta do usuário em uma versão
 autossuficiente para melhorar recuperação no RAG.
 """
 
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+# numpy é opcional aqui: sem ele o cache semântico fica desativado.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import openai
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from src.infra.http_client import get_async_http_client
 
 from .prompts import (
-    get_query_rewrite_prompt,
+    get_query_rewrite_messages,
     detect_language,
 )
 
-# LLM assíncrono 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)  # Using cheaper model for rewriting
+logger = logging.getLogger("bgo_chatbot.rewrite")
 
-async def rewrite_query(question: str, chat_history: str = "") -> str:
-    """
-    Recebe a pergunta e (opcionalmente) histórico de conversa e retorna
-    uma versão reformulada/autossuficiente.
-    
-    Args:
-        question: Pergunta original do usuário
-        chat_history: Histórico de conversa formatado (pode ser vazio)
-        
-    Returns:
-        Pergunta reescrita, otimizada para busca semântica
-    """
-  # Detect language and get appropriate prompt
+# LLM assíncrono — compartilha o pool httpx do processo (sem churn de
+# conexão sob concorrência)
+llm = ChatOpenAI(
+    model="gpt-4o-mini",  # Using cheaper model for rewriting
+    temperature=0,
+    http_async_client=get_async_http_client(),
+)
+
+# Micro-batching opcional: coalesce rewrites concorrentes em uma chamada
+# só ao LLM, amortizando o overhead fixo por requisição (HTTP/TLS/prefill).
+# Desligado por padrão — só vale a pena sob carga concorrente real.
+REWRITE_BATCHING = os.getenv("REWRITE_BATCHING", "false").strip().lower() in (
+    "1", "true", "yes"
+)
+_BATCH_MAX_SIZE = 8
+_BATCH_WINDOW_S = 0.005  # janela de coalescência (5ms)
+
+# Linhas numeradas da resposta em lote ("1. pergunta reescrita")
+_BATCH_LINE_PATTERN = re.compile(r"^\s*\d+[\.\)]\s*(.+?)\s*$", re.MULTILINE)
+
+_BATCH_SYSTEM = (
+    "Reescreva cada pergunta numerada abaixo como uma pergunta autossuficiente "
+    "e otimizada para busca semântica, mantendo o idioma original de cada uma. "
+    "Responda APENAS com as perguntas reescritas, uma por linha, "
+    "com a mesma numeração."
+)
+
+
+# Retry granular na chamada remota (só rate limit/timeout): falhas aqui
+# não devem re-executar o resto do pipeline.
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(min=1, max=4),
+    retry=retry_if_exception_type((openai.RateLimitError, openai.APITimeoutError)),
+    reraise=True,
+)
+async def _invoke_llm(messages):
+    return await llm.ainvoke(messages)
+
+
+async def _rewrite_single(question: str, chat_history: str = "") -> str:
+    """Caminho normal: uma pergunta, uma chamada ao LLM."""
+    # Detect language and get appropriate prompt
     language = detect_language(question)
-    
+
     # Determine if we should use minimal prompt
     use_minimal = not chat_history or not chat_history.strip()
-    
-    # Get formatted prompt
-    prompt_text = get_query_rewrite_prompt(
+    if use_minimal:
+        # O template minimal ignora o histórico; zerar aqui faz todo o
+        # caminho sem histórico compartilhar uma única chave de cache
+        # (histórico só-espaços não gera entradas distintas).
+        chat_history = ""
+
+    # Instruções estáticas como system message + conteúdo dinâmico como
+    # human message: o prefixo idêntico entre chamadas aproveita o
+    # prompt cache do provedor.
+    system_text, user_text = get_query_rewrite_messages(
         question=question,
         chat_history=chat_history,
         language=language,
         use_minimal=use_minimal
     )
-    # chamada assíncrona ao modelo
-    response = await llm.ainvoke(prompt_text)
+    # chamada assíncrona ao modelo (com retry em rate limit/timeout)
+    response = await _invoke_llm([
+        ("system", system_text),
+        ("human", user_text),
+    ])
 
     # response.content contém o texto gerado
     return response.content.strip()
+
+
+class _RewriteBatcher:
+    """Coalesce perguntas concorrentes (sem histórico) em um prompt único.
+
+    Um worker preguiçoso drena a fila: espera a janela de alguns ms por
+    companheiros de lote, manda as perguntas numeradas em uma chamada só
+    e distribui as respostas pelos futures. Se a resposta não vier no
+    formato esperado, cada pergunta é reprocessada individualmente.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: asyncio.Task | None = None
+
+    async def rewrite(self, question: str) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put_nowait((question, future))
+        # Worker nasce na primeira chamada e morre quando fica ocioso —
+        # dispensa hook de startup no app.
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._drain())
+        return await future
+
+    async def _drain(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                return
+
+            batch = [item]
+            deadline = loop.time() + _BATCH_WINDOW_S
+            while len(batch) < _BATCH_MAX_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            await self._process(batch)
+
+    async def _process(self, batch: list) -> None:
+        if len(batch) == 1:
+            await self._fallback(batch)
+            return
+
+        numbered = "\n".join(f"{i}. {q}" for i, (q, _) in enumerate(batch, 1))
+        try:
+            response = await _invoke_llm([
+                ("system", _BATCH_SYSTEM),
+                ("human", numbered),
+            ])
+            rewritten = _BATCH_LINE_PATTERN.findall(response.content)
+        except Exception:
+            rewritten = []
+
+        if len(rewritten) == len(batch):
+            for (_, future), text in zip(batch, rewritten):
+                if not future.done():
+                    future.set_result(text)
+            return
+
+        # Resposta fora do formato (ou erro): reprocessa uma a uma.
+        await self._fallback(batch)
+
+    async def _fallback(self, batch: list) -> None:
+        for question, future in batch:
+            if future.done():
+                continue
+            try:
+                future.set_result(await _rewrite_single(question))
+            except Exception as exc:
+                future.set_exception(exc)
+
+
+_batcher = _RewriteBatcher()
+
+# Cache semântico de rewrites: perguntas que variam só na forma ("qual a
+# duração?" vs "quanto tempo dura a prova?") compartilham o rewrite sem
+# nova ida ao GPT. O embedding vem de um modelo local pequeno — nada de
+# rede no lookup. Opt-in via env: o modelo custa download/RAM e só
+# compensa com tráfego repetitivo de verdade.
+REWRITE_SEMANTIC_CACHE = os.getenv(
+    "REWRITE_SEMANTIC_CACHE", "false"
+).strip().lower() in ("1", "true", "yes")
+_SEM_THRESHOLD = float(os.getenv("REWRITE_SEMANTIC_THRESHOLD", "0.93"))
+_SEM_MAX_ENTRIES = 4096
+_SEM_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# LSH por projeção aleatória: o sinal de 16 projeções vira um código de
+# bucket, e o cosseno só é computado contra o bucket (e vizinhos a 1 bit
+# de distância) em vez da matriz inteira. 4 tabelas independentes
+# recuperam o recall que um código só perderia na fronteira dos planos.
+_LSH_TABLES = 4
+_LSH_BITS = 16
+_LSH_SEED = 2025
+
+# Persistência do cache semântico: matriz em .npy (mmap no load — os
+# bytes vêm do page cache, sem cópia) + rewrites em JSON. Sem isso,
+# cada restart do processo recomeça frio e as primeiras centenas de
+# queries pagam o LLM de novo.
+_SEM_PERSIST_DIR = Path(
+    os.getenv("REWRITE_SEMANTIC_CACHE_DIR", "data/processed/rewrite_cache")
+)
+_SEM_PERSIST_EVERY = 32  # grava a cada N inserções
+
+
+class _SemanticRewriteCache:
+    """Cache de rewrites por similaridade de cosseno.
+
+    Matriz (N, 384) de embeddings L2-normalizados paralela à lista de
+    rewrites. O lookup usa LSH por projeção aleatória: o código de bits
+    do vetor seleciona um bucket por tabela, e o cosseno roda só contra
+    esses candidatos — O(bucket) em vez de O(N·d). Entradas só para
+    perguntas SEM histórico — com contexto de conversa a mesma
+    superfície pode significar outra coisa. Evicção LRU por compactação:
+    cheio, mantém a metade usada mais recentemente.
+    """
+
+    def __init__(self) -> None:
+        self._model = None
+        self._model_failed = False
+        self._matrix = None  # (N, 384) float32, linhas L2-normalizadas
+        self._rewrites: list = []
+        self._ticks: list = []  # último uso por entrada (relógio lógico)
+        self._clock = 0
+        # Uma matriz de projeção fixa (seeded) por tabela; criadas no
+        # primeiro add, quando a dimensão do embedding é conhecida.
+        self._projections = None
+        # code (int de _LSH_BITS bits) -> índices de linhas da matriz
+        self._buckets = [dict() for _ in range(_LSH_TABLES)]
+        self._loaded = False
+        self._adds_since_save = 0
+
+    @property
+    def enabled(self) -> bool:
+        return REWRITE_SEMANTIC_CACHE and np is not None and not self._model_failed
+
+    def _encode(self, question: str):
+        if self._model is None:
+            # Import/load preguiçoso: o modelo (~400MB) só entra em
+            # memória se o cache estiver ligado e for realmente usado.
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(_SEM_MODEL_NAME, device="cpu")
+        vec = self._model.encode(
+            question, convert_to_numpy=True, show_progress_bar=False
+        ).astype(np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    async def embed(self, question: str):
+        """Embedding normalizado da pergunta; None se o modelo falhar."""
+        try:
+            return await asyncio.to_thread(self._encode, question)
+        except Exception as e:
+            # Modelo indisponível (pacote/download): desliga o cache e
+            # segue pelo caminho normal, sem tentar de novo a cada query.
+            self._model_failed = True
+            logger.warning("Semantic rewrite cache disabled: %s", e)
+            return None
+
+    # ---------------- persistência ----------------
+
+    def _init_projections(self, dim: int) -> None:
+        rng = np.random.default_rng(_LSH_SEED)
+        self._projections = [
+            rng.standard_normal((dim, _LSH_BITS)).astype(np.float32)
+            for _ in range(_LSH_TABLES)
+        ]
+
+    def _ensure_loaded(self) -> None:
+        """Warm-start: na primeira utilização, recarrega o cache salvo."""
+        if self._loaded:
+            return
+        self._loaded = True
+        matrix_path = _SEM_PERSIST_DIR / "embeddings.npy"
+        rewrites_path = _SEM_PERSIST_DIR / "rewrites.json"
+        if not (matrix_path.exists() and rewrites_path.exists()):
+            return
+        try:
+            # mmap: os int8/float32 ficam no page cache, zero-copy até
+            # a primeira inserção (o vstack do add copia naturalmente).
+            matrix = np.load(matrix_path, mmap_mode="r")
+            with open(rewrites_path, encoding="utf-8") as f:
+                rewrites = json.load(f)
+            if matrix.shape[0] != len(rewrites):
+                raise ValueError("matrix/rewrites length mismatch")
+            self._matrix = matrix
+            self._rewrites = list(rewrites)
+            self._clock = len(rewrites)
+            self._ticks = list(range(1, self._clock + 1))
+            self._init_projections(matrix.shape[1])
+            self._rebuild_buckets()
+            logger.info(
+                "Semantic rewrite cache warm-started with %d entries", len(rewrites)
+            )
+        except Exception as e:
+            logger.warning("Semantic rewrite cache warm-start failed: %s", e)
+            self._matrix = None
+            self._rewrites = []
+            self._ticks = []
+            self._clock = 0
+            self._projections = None
+            self._buckets = [dict() for _ in range(_LSH_TABLES)]
+
+    def _persist(self) -> None:
+        """Grava matriz + rewrites de forma atômica (tmp + replace)."""
+        try:
+            _SEM_PERSIST_DIR.mkdir(parents=True, exist_ok=True)
+            # Nome do tmp termina em .npy para o np.save não anexar outro
+            matrix_tmp = _SEM_PERSIST_DIR / "embeddings_tmp.npy"
+            rewrites_tmp = _SEM_PERSIST_DIR / "rewrites.json.tmp"
+            np.save(matrix_tmp, np.ascontiguousarray(self._matrix))
+            with open(rewrites_tmp, "w", encoding="utf-8") as f:
+                json.dump(self._rewrites, f, ensure_ascii=False)
+            os.replace(matrix_tmp, _SEM_PERSIST_DIR / "embeddings.npy")
+            os.replace(rewrites_tmp, _SEM_PERSIST_DIR / "rewrites.json")
+        except Exception as e:
+            logger.warning("Semantic rewrite cache persist failed: %s", e)
+
+    # ---------------- LSH ----------------
+
+    def _code(self, vec, projection) -> int:
+        bits = (vec @ projection) > 0
+        return int((bits * (1 << np.arange(_LSH_BITS))).sum())
+
+    def _register(self, index: int, vec) -> None:
+        for table, projection in zip(self._buckets, self._projections):
+            table.setdefault(self._code(vec, projection), []).append(index)
+
+    def _rebuild_buckets(self) -> None:
+        self._buckets = [dict() for _ in range(_LSH_TABLES)]
+        for index in range(len(self._rewrites)):
+            self._register(index, self._matrix[index])
+
+    def _candidates(self, query_vec):
+        """Índices dos buckets do query em cada tabela + vizinhos a 1 bit."""
+        found = set()
+        for table, projection in zip(self._buckets, self._projections):
+            code = self._code(query_vec, projection)
+            bucket = table.get(code)
+            if bucket:
+                found.update(bucket)
+            # Vizinhos a 1 bit: vetores quase iguais do outro lado de um
+            # único hiperplano ainda entram na comparação.
+            for bit in range(_LSH_BITS):
+                bucket = table.get(code ^ (1 << bit))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+    # ---------------- interface ----------------
+
+    def lookup(self, query_vec):
+        if query_vec is None:
+            return None
+        self._ensure_loaded()
+        if self._matrix is None:
+            return None
+        candidates = self._candidates(query_vec)
+        if not candidates:
+            return None
+        idx = np.fromiter(candidates, dtype=np.int64)
+        scores = self._matrix[idx] @ query_vec
+        best_pos = int(np.argmax(scores))
+        if scores[best_pos] < _SEM_THRESHOLD:
+            return None
+        best = int(idx[best_pos])
+        self._clock += 1
+        self._ticks[best] = self._clock
+        return self._rewrites[best]
+
+    def add(self, query_vec, rewritten: str) -> None:
+        if query_vec is None:
+            return
+        self._ensure_loaded()
+        if self._projections is None:
+            self._init_projections(query_vec.shape[0])
+        if self._matrix is not None and len(self._rewrites) >= _SEM_MAX_ENTRIES:
+            order = np.argsort(self._ticks)
+            keep = np.zeros(len(self._rewrites), dtype=bool)
+            keep[order[len(order) // 2:]] = True
+            self._matrix = self._matrix[keep]
+            self._rewrites = [r for r, k in zip(self._rewrites, keep) if k]
+            self._ticks = [t for t, k in zip(self._ticks, keep) if k]
+            # Os índices mudaram com a compactação — refaz os buckets.
+            self._rebuild_buckets()
+
+        self._clock += 1
+        row = query_vec.reshape(1, -1)
+        self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+        self._rewrites.append(rewritten)
+        self._ticks.append(self._clock)
+        self._register(len(self._rewrites) - 1, query_vec)
+
+        self._adds_since_save += 1
+        if self._adds_since_save >= _SEM_PERSIST_EVERY:
+            self._adds_since_save = 0
+            self._persist()
+
+
+_semantic_cache = _SemanticRewriteCache()
+
+# Cache exato de rewrites: (pergunta, histórico) repetidos — comuns em
+# runs de regressão e em refresh de página — devolvem a string já
+# reescrita sem ida ao LLM. As entradas guardam Futures (single-flight):
+# chamadas concorrentes idênticas esperam a MESMA chamada remota em vez
+# de disparar N. Idioma e template são derivados deterministicamente da
+# pergunta/histórico, então não precisam entrar na chave.
+_REWRITE_CACHE_MAX_ENTRIES = 1024
+_rewrite_cache: "OrderedDict[bytes, asyncio.Future]" = OrderedDict()
+
+
+def _rewrite_cache_key(question: str, chat_history: str) -> bytes:
+    return hashlib.blake2b(
+        question.encode("utf-8") + b"|" + chat_history.encode("utf-8"),
+        digest_size=16,
+    ).digest()
+
+
+async def _compute_rewrite(question: str, chat_history: str) -> str:
+    """Resolve o rewrite: cache semântico -> batcher/LLM -> popula cache."""
+    query_vec = None
+    if not chat_history and _semantic_cache.enabled:
+        query_vec = await _semantic_cache.embed(question)
+        hit = _semantic_cache.lookup(query_vec)
+        if hit is not None:
+            return hit
+
+    # Só o caso sem histórico é coalescível: com histórico cada
+    # pergunta precisa do próprio contexto no prompt.
+    if REWRITE_BATCHING and not chat_history:
+        rewritten = await _batcher.rewrite(question)
+    else:
+        rewritten = await _rewrite_single(question, chat_history)
+
+    _semantic_cache.add(query_vec, rewritten)
+    return rewritten
+
+
+async def rewrite_query(question: str, chat_history: str = "") -> str:
+    """
+    Recebe a pergunta e (opcionalmente) histórico de conversa e retorna
+    uma versão reformulada/autossuficiente.
+
+    Args:
+        question: Pergunta original do usuário
+        chat_history: Histórico de conversa formatado (pode ser vazio)
+
+    Returns:
+        Pergunta reescrita, otimizada para busca semântica
+    """
+    # Histórico só-espaços equivale a vazio (mesma normalização do
+    # _rewrite_single) — compartilha a chave de cache do caminho simples.
+    if not chat_history or not chat_history.strip():
+        chat_history = ""
+
+    key = _rewrite_cache_key(question, chat_history)
+    cached = _rewrite_cache.get(key)
+    if cached is not None:
+        _rewrite_cache.move_to_end(key)
+        # shield: cancelar ESTE caller não pode cancelar o Future que
+        # outros callers (ou o dono da chamada) ainda esperam.
+        return await asyncio.shield(cached)
+
+    future = asyncio.get_running_loop().create_future()
+    _rewrite_cache[key] = future
+    if len(_rewrite_cache) > _REWRITE_CACHE_MAX_ENTRIES:
+        _rewrite_cache.popitem(last=False)
+
+    try:
+        rewritten = await _compute_rewrite(question, chat_history)
+    except BaseException as exc:
+        # Falha (ou cancelamento) não fica cacheada: a próxima chamada
+        # idêntica tenta o LLM de novo.
+        _rewrite_cache.pop(key, None)
+        if not future.done():
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                future.exception()  # dono propaga via raise; evita warning
+        raise
+
+    future.set_result(rewritten)
+    return rewritten
+
+
+def _rewrite_cache_clear() -> None:
+    """Esvazia o cache exato de rewrites (para testes)."""
+    _rewrite_cache.clear()
+
+
+rewrite_query.cache_clear = _rewrite_cache_clear
@@ -1,50 +1,150 @@
+import argparse
+import asyncio
 import json
 import os
+import time
 
 from chatbot.run_chatbot import run_chatbot
 from tests.evaluator import evaluate_response
-from reports.reports import generate_report, save_reports
+from reports.reports import generate_report, iter_results_jsonl, save_reports
 
 
 TEST_FILE = "tests/hallucination_tests.json"
 
+# Resultados crus em JSONL incremental: cada teste avaliado vira uma
+# linha no disco na hora, então a memória residente não cresce com o
+# tamanho da suíte e uma queda no meio não perde o que já rodou.
+RESULTS_JSONL = os.path.join("reports", "results.jsonl")
+
+# fsync a cada N resultados — durabilidade sem um sync por linha
+_FSYNC_EVERY = 20
+
+# Chamadas ao chatbot em voo simultâneo: com latência de ~2s por LLM,
+# a suíte inteira cai de N×2s para ~N/concorrência.
+CONCURRENCY = int(os.getenv("REGRESSION_CONCURRENCY", "10"))
+
+
+async def _collect_responses(tests: list) -> list:
+    """Roda o chatbot para todos os testes com concorrência limitada.
+
+    gather preserva a ordem dos testes; o semáforo segura o fan-out para
+    não estourar rate limit do provedor. run_chatbot é síncrono, então
+    cada chamada vai para uma thread via to_thread.
+    """
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(test: dict) -> str:
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(run_chatbot, test["prompt"])
+            except Exception as e:
+                return f"[ERROR DURING CHATBOT EXECUTION] {e}"
+
+    return await asyncio.gather(*(one(test) for test in tests))
+
+
+def _already_done_ids() -> set:
+    """IDs já gravados num JSONL de uma execução interrompida."""
+    done = set()
+    if os.path.exists(RESULTS_JSONL):
+        for result in iter_results_jsonl(RESULTS_JSONL):
+            if result.get("id") is not None:
+                done.add(result["id"])
+    return done
+
+
+def _iter_results_deduped(path: str):
+    """Itera o JSONL pulando linhas repetidas do mesmo id.
+
+    Uma retomada pode reescrever testes cuja linha já tinha sido gravada
+    antes da queda; para o relatório vale a primeira ocorrência.
+    """
+    seen = set()
+    for result in iter_results_jsonl(path):
+        rid = result.get("id")
+        if rid is not None:
+            if rid in seen:
+                continue
+            seen.add(rid)
+        yield result
+
 
 def main():
+    parser = argparse.ArgumentParser(description="OBG Hallucination Regression Runner")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="retoma uma execução interrompida, pulando ids já gravados no JSONL",
+    )
+    args = parser.parse_args()
+
     print(">>> REGRESSION TEST STARTED <<<")
 
     with open(TEST_FILE, "r", encoding="utf-8") as f:
         tests = json.load(f)
 
-    results = []
-
+    # Normaliza as forbidden keywords uma vez no load: o evaluator
+    # compara contra a resposta já minúscula e espera keywords
+    # minúsculas, sem re-lower por chamada no hot loop.
     for test in tests:
-        prompt = test["prompt"]
-        category = test.get("category", "uncategorized")
-
-        try:
-            response = run_chatbot(prompt)
-        except Exception as e:
-            response = f"[ERROR DURING CHATBOT EXECUTION] {e}"
-
-        score, reason = evaluate_response(
-            prompt=prompt,
-            response=response,
-            expected_behavior=test.get("expected_behavior"),
-            forbidden_keywords=test.get("forbidden_keywords"),
-        )
-
-        results.append({
-            "id": test.get("id"),
-            "category": category,
-            "prompt": prompt,
-            "response": response,
-            "score": score,
-            "reason": reason,
-        })
-
-    # 🔬 Geração de relatório científico
-    report = generate_report(results)
-    save_reports(results, report)
+        test["forbidden_keywords"] = [
+            k.lower() for k in test.get("forbidden_keywords") or []
+        ]
+
+    # Retomada só com --resume explícito: testes com id já presente no
+    # JSONL não rodam de novo e o relatório inclui os antigos. Sem o
+    # flag, a execução começa do zero ("w" trunca sobras de uma queda).
+    write_mode = "w"
+    if args.resume:
+        done_ids = _already_done_ids()
+        if done_ids:
+            tests = [t for t in tests if t.get("id") not in done_ids]
+            print(f">>> Resuming: {len(done_ids)} results found, {len(tests)} to run <<<")
+            write_mode = "a"
+
+    # Fase 1: respostas em paralelo (I/O-bound, domina o wallclock)
+    responses = asyncio.run(_collect_responses(tests))
+
+    # Fase 2: avaliação síncrona (ordem preservada pelo zip), cada
+    # resultado escrito no JSONL na hora em vez de acumulado em lista
+    os.makedirs(os.path.dirname(RESULTS_JSONL), exist_ok=True)
+    with open(RESULTS_JSONL, write_mode, encoding="utf-8") as out:
+        for i, (test, response) in enumerate(zip(tests, responses), 1):
+            prompt = test["prompt"]
+            category = test.get("category", "uncategorized")
+
+            score, reason = evaluate_response(
+                prompt=prompt,
+                response=response,
+                expected_behavior=test.get("expected_behavior"),
+                forbidden_keywords=test.get("forbidden_keywords"),
+            )
+
+            out.write(json.dumps({
+                "id": test.get("id"),
+                "category": category,
+                "prompt": prompt,
+                "response": response,
+                "score": score,
+                "reason": reason,
+            }, ensure_ascii=False) + "\n")
+
+            if i % _FSYNC_EVERY == 0:
+                out.flush()
+                os.fsync(out.fileno())
+
+    # 🔬 Geração de relatório científico — lê o JSONL preguiçosamente
+    report = generate_report(_iter_results_deduped(RESULTS_JSONL))
+    save_reports(None, report)
+
+    # Execução completa: arquiva o JSONL com timestamp para a próxima
+    # rodada começar limpa — só uma queda deixa results.jsonl para trás,
+    # e aí --resume retoma de onde parou.
+    archived = RESULTS_JSONL.replace(
+        ".jsonl", time.strftime("_%Y%m%d_%H%M%S.jsonl")
+    )
+    os.replace(RESULTS_JSONL, archived)
+    print(f"[OK] Raw results → {archived}")
 
     print(">>> REGRESSION TEST FINISHED <<<")
 
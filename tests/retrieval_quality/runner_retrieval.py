@@ -333,7 +333,9 @@ def main():
         else os.path.join(_PROJECT_ROOT, _raw_index_path)
     )
     print(f"  Loading FAISS index from: {index_path}")
-    init_vectorstore(index_path)
+    # mmap: o runner é um processo descartável — não vale copiar o índice
+    # inteiro para a RAM só para uma passada de avaliação.
+    init_vectorstore(index_path, mmap=True)
     retriever = get_retriever(k=K)
 
     results = []